@@ -1,3 +1,6 @@
 # init for acquisition module
-from gnss.acquisition.coarse import CoarseAcquirer, CoarseAcquirerLowMem
-from gnss.acquisition.fine import FineAcquirer
+from gnss.acquisition.coarse import CoarseAcquirer, CoarseAcquirerLowMem, CoarseAcquirerStreaming, CoarseAcquirerHierarchical, CoarseAcquirerBatch, CANDIDATE_DTYPE, ACQUISITION_RESULT_DTYPE
+from gnss.acquisition.aided import AidedAcquirer, cross_band_window
+from gnss.acquisition.longcode import LongCodeAcquirer
+from gnss.acquisition.parallel import ParallelAcquirer
+from gnss.acquisition.fine import FineAcquirer, FINE_ACQUISITION_RESULT_DTYPE
@@ -0,0 +1,145 @@
+import numpy
+from numpy import arange, absolute, log, sqrt, unravel_index
+from gnss.signals.nco import CarrierNCO
+from gnss.acquisition.coarse import CoarseAcquirer, partial_correlation, noise_phases
+
+
+def cross_band_window(reference, f_dopp, chip, signal, dopp_uncertainty=250., chip_uncertainty=.5,
+                      code_delay_margin=1e-7, epoch=None):
+    """
+    Predicts where to search for `signal` given the acquired or tracked Doppler
+    `f_dopp` and code phase `chip` of `reference`, a signal of the same SV on
+    another carrier (e.g. L1 C/A for L2C or L5) at the same receive time.
+
+    Doppler scales with the ratio of carrier frequencies. All codes of an SV start
+    together, so `chip` fixes the transmit time modulo the reference code period;
+    a longer `signal` code has one candidate code phase per reference code period
+    it spans, unless `epoch`, the number of whole reference periods into the
+    `signal` code period, is known (e.g. from bit sync). `code_delay_margin`
+    (seconds) covers inter-signal and ionospheric delay differences. Candidates for
+    a code with an overlay (e.g. L5 with its Neuman-Hofman code) only differ in the
+    overlay, so the search block needs to span several overlay bits to tell them
+    apart.
+
+    inputs
+    ------
+
+    dopp_uncertainty:
+        uncertainty of `f_dopp` (Hz), e.g. half an acquisition bin
+    chip_uncertainty:
+        uncertainty of `chip` (reference chips)
+
+    Returns `(f_dopp, dopp_uncertainty, chips, chip_uncertainty)` for `signal`, as
+    taken by `AidedAcquirer.acquire`.
+    """
+    ratio = signal.f_carrier / reference.f_carrier
+    transmit_time = chip / reference.code.rate  # modulo the reference code period
+    reference_period = reference.code.length / reference.code.rate
+    num_epochs = max(1, int(round(signal.code.length / signal.code.rate / reference_period)))
+    epochs = arange(num_epochs) if epoch is None else numpy.asarray([epoch % num_epochs])
+    chips = ((transmit_time + epochs * reference_period) * signal.code.rate) % signal.code.length
+    chip_uncertainty = (chip_uncertainty / reference.code.rate + code_delay_margin) * signal.code.rate
+    return f_dopp * ratio, dopp_uncertainty * ratio, chips, chip_uncertainty
+
+
+class AidedAcquirer(CoarseAcquirer):
+    """
+    Acquisition within a predicted Doppler and code phase window, e.g. for
+    reacquisition after a short outage or a hot start from orbits and a known
+    receiver position.
+
+    `acquire` searches `f_dopp +/- dopp_uncertainty` at `1 / block_length` spacing,
+    coherently over one block. With a predicted `chip +/- chip_uncertainty` (the
+    code phase at the requested time) only those code phases are searched: if
+    they number at most `max_partial_phases` (default: twice log2 of the block
+    length in samples), or the code period is longer than the block, they are
+    correlated directly in the time domain, otherwise the FFT correlation of
+    `CoarseAcquirer` is searched within the window.
+
+    `f_dopp`, `chip`, `n0`, `snr` and `cn0` are defined as for `CoarseAcquirer`; in
+    the time domain the noise floor is measured at `num_noise_phases` code phases
+    away from the peak. `corr` holds the correlation magnitudes of the searched
+    window, as (code phase, Doppler bin).
+    """
+
+    def __init__(self, source, block_length, dopp_search='shift', max_partial_phases=None, num_noise_phases=32):
+        if dopp_search not in ('replica', 'shift'):
+            raise ValueError('`dopp_search` must be one of \'replica\' or \'shift\'')
+        self.dopp_search = dopp_search
+        self.block_length = block_length
+        self.num_blocks = 1
+        self.source = source
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
+        self.num_samples = self.num_block_samples
+        self.t = arange(self.num_block_samples) / source.f_samp
+        if max_partial_phases is None:
+            max_partial_phases = 2 * int(numpy.log2(self.num_block_samples))
+        self.max_partial_phases = max_partial_phases
+        self.num_noise_phases = num_noise_phases
+        self.time = None
+        self.dopp_bins = None
+        self.corr = None
+
+    def acquire(self, signal, f_dopp, dopp_uncertainty, chip=None, chip_uncertainty=None, time=None):
+        """
+        `chip` may also be a sequence of candidate code phases, e.g. when only the
+        phase modulo a shorter code is known; each gets a `chip_uncertainty` window.
+        """
+        samples, self.time = self.source.get(self.num_samples, time)
+        samples = samples[:self.num_samples]
+        f_samp = self.source.f_samp
+        samples_per_code = int(signal.code.length * f_samp / signal.code.rate)
+        num_bins = int(numpy.ceil(dopp_uncertainty * self.block_length))
+        self.dopp_bins = f_dopp + arange(-num_bins, num_bins + 1) / self.block_length
+        windows = None
+        if chip is not None:
+            chips = numpy.atleast_1d(numpy.asarray(chip, dtype=float))
+            if time is not None:
+                chips = chips + (self.time - time) * signal.code.rate * (1. + f_dopp / signal.f_carrier)
+            centers = numpy.round((1. - chips / len(signal.code.sequence)) * samples_per_code).astype(int)
+            width = int(numpy.ceil(chip_uncertainty * samples_per_code / len(signal.code.sequence)))
+            if len(centers) * (2 * width + 1) < samples_per_code:
+                windows = [arange(n - width, n + width + 1) for n in centers]
+        num_phases = 0 if windows is None else len(windows) * len(windows[0])
+        # codes longer than a block cannot be correlated circularly over the block
+        if windows is not None and (num_phases <= self.max_partial_phases or samples_per_code > len(samples)):
+            wiped = samples * CarrierNCO(f_samp, signal.f_carrier - self.source.f_center + f_dopp).samples(len(samples), -1)
+            self.corr = numpy.concatenate([partial_correlation(wiped, f_samp, signal, f_dopp, phases, samples_per_code,
+                                                               self.dopp_bins - f_dopp) for phases in windows])
+            p, i = unravel_index(self.corr.argmax(), self.corr.shape)
+            n0 = numpy.concatenate(windows)[p]
+            phases = noise_phases(n0, samples_per_code, self.num_noise_phases, max(1, int(f_samp / signal.code.rate)))
+            noise = partial_correlation(wiped, f_samp, signal, f_dopp, phases, samples_per_code,
+                                        self.dopp_bins[i:i + 1] - f_dopp)
+            corr_max, corr_mean, corr_std = self.corr[p, i], noise.mean(), noise.std()
+        else:
+            nsc = min(samples_per_code, self.num_block_samples)
+            searched = None if windows is None else numpy.concatenate(windows) % samples_per_code
+            self.corr = numpy.zeros((nsc if searched is None else len(searched), len(self.dopp_bins)))
+            corr_sum = corr_sum_sq = 0.
+            for i, correlation in self.correlations(signal, samples):
+                magnitude = absolute(correlation[:nsc])
+                corr_sum += magnitude.sum()
+                corr_sum_sq += (magnitude**2).sum()
+                self.corr[:, i] = magnitude if searched is None else magnitude[searched]
+            p, i = unravel_index(self.corr.argmax(), self.corr.shape)
+            n0 = p if searched is None else searched[p]
+            count = nsc * len(self.dopp_bins)
+            corr_max, corr_mean = self.corr[p, i], corr_sum / count
+            corr_std = sqrt(corr_sum_sq / count - corr_mean**2)
+        self.n0 = n0 % samples_per_code
+        self.f_dopp = self.dopp_bins[i]
+        self.chip = (1. - self.n0 / samples_per_code) * len(signal.code.sequence)
+        self.snr = 10 * log((corr_max - corr_mean) / corr_std)
+
+    def acquire_cross_band(self, signal, reference, f_dopp, chip, time=None, dopp_uncertainty=250.,
+                           chip_uncertainty=.5, code_delay_margin=1e-7, epoch=None):
+        """
+        Acquires `signal` within the window predicted by `cross_band_window` from the
+        state (`f_dopp`, `chip` at `time`) of `reference`, e.g. `acquirer.f_dopp`,
+        `acquirer.chip` and `acquirer.time` of an L1 C/A acquisition on a source for
+        the reference band. `source` must cover the same time span.
+        """
+        f_dopp, dopp_uncertainty, chips, chip_uncertainty = cross_band_window(
+            reference, f_dopp, chip, signal, dopp_uncertainty, chip_uncertainty, code_delay_margin, epoch)
+        self.acquire(signal, f_dopp, dopp_uncertainty, chips, chip_uncertainty, time)
@@ -1,14 +1,71 @@
 
 import numpy
-from numpy import arange, zeros, complex64, floor, exp, absolute, conj, mean, unravel_index, std, log, argmax, pi, var, std
+from collections import OrderedDict
+from numpy import arange, zeros, complex64, exp, absolute, mean, unravel_index, std, log, argmax, pi, var, std
+from numpy import outer, vstack, sqrt, asarray, array, argsort, concatenate, float32
+from gnss.signals.replicas import replica_cache, sample_code
+from gnss.signals.nco import CarrierNCO, carrier_replicas
 npsum = numpy.sum
 npmax = numpy.max
 fft = numpy.fft.fft
 ifft = numpy.fft.ifft
 
+
+def partial_correlation(wiped, f_samp, signal, f_dopp, phases, samples_per_code, dopp_offsets):
+    """
+    Correlates carrier-wiped samples `wiped` with the code of `signal` at a few code
+    `phases` (samples, in increasing order and not necessarily reduced modulo
+    `samples_per_code`) and small Doppler offsets `dopp_offsets` (Hz) from `f_dopp`
+    in the time domain, and returns the correlation magnitudes as a
+    `(len(phases), len(dopp_offsets))` array.
+
+    One replica spanning all `phases` is generated and each phase correlates with
+    a slice of it, so `phases` should lie close together. Each despread code phase
+    is summed over sub-intervals short enough that the Doppler offsets hardly
+    decorrelate within them, and all offsets follow from one small matrix product.
+    """
+    first, last = phases[0], phases[-1]
+    chip = (1. - last / samples_per_code) * len(signal.code.sequence)
+    # a one-off code phase and length, not worth caching
+    replica = sample_code(signal, f_samp, len(wiped) + last - first, f_dopp, chip)
+    max_offset = npmax(absolute(dopp_offsets))
+    sub_length = int(min(len(wiped), max(1, f_samp / (8 * max_offset)))) if max_offset else len(wiped)
+    starts = arange(0, len(wiped), sub_length)
+    centers = (starts + (numpy.minimum(starts + sub_length, len(wiped)) - starts) / 2.) / f_samp
+    steering = exp(-2j * pi * outer(dopp_offsets, centers))
+    corr = zeros((len(phases), len(dopp_offsets)))
+    for k, n in enumerate(phases):
+        # the code at phase `n` starts `last - n` samples into the replica of phase `last`
+        start = last - n
+        corr[k] = absolute(steering.dot(numpy.add.reduceat(wiped * replica[start:start + len(wiped)], starts)))
+    return corr
+
+
+def noise_phases(n0, samples_per_code, num_phases, spacing):
+    """
+    Returns `num_phases` code phases `spacing` samples apart, starting a quarter
+    code period after `n0`, where the correlation is noise.
+    """
+    return n0 + samples_per_code // 4 + arange(num_phases) * spacing
+
+
 class CoarseAcquirer:
+    """
+    `dopp_search` selects how Doppler bins are searched:
+
+    'replica':
+        a carrier-modulated code replica is generated and FFT'd for every bin
+    'shift':
+        the code replica and the (residual carrier wiped) data are FFT'd once and every
+        bin is a circular shift of the replica spectrum, so a bin costs a multiply and
+        an IFFT. Bins on the `1 / block_length` grid share one residual rotation.
+    """
     
-    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000):
+    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000,
+                 dopp_search='replica'):
+        if dopp_search not in ('replica', 'shift'):
+            raise ValueError('`dopp_search` must be one of \'replica\' or \'shift\'')
+        self.dopp_search = dopp_search
         self.block_length = block_length
         self.num_blocks = num_blocks   
         if dopp_bins is None:
@@ -16,7 +73,7 @@ class CoarseAcquirer:
         else:
             self.dopp_bins = dopp_bins
         self.source = source
-        self.num_block_samples = self.block_length * source.f_samp
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
         self.num_samples = self.num_blocks * self.num_block_samples
         self.correlation = zeros((len(self.dopp_bins), self.num_block_samples), dtype=complex64)
         self.t = arange(self.num_block_samples) / source.f_samp
@@ -28,18 +85,41 @@ class CoarseAcquirer:
     @property
     def cn0(self):
         return self.snr + 10 * log(1 / self.block_length)
+    
+    def correlations(self, signal, samples):
+        """
+        Yields `(i, correlation)` for every Doppler bin `i`, where `correlation` is the
+        circular correlation of the code replica with `samples`, averaged over blocks.
+        """
+        blocks = samples[:self.num_samples].reshape((self.num_blocks, self.num_block_samples))
+        f_inter = signal.f_carrier - self.source.f_center
+        f_samp = self.source.f_samp
+        if self.dopp_search == 'replica':
+            fft_blocks = fft(blocks, axis=1)
+            for i, f_dopp in enumerate(self.dopp_bins):
+                conjugate_fft = replica_cache.conjugate_spectrum(signal, f_samp, self.num_block_samples, f_inter + f_dopp)
+                yield i, npsum(ifft(conjugate_fft * fft_blocks), axis=0) / self.num_blocks
+            return
+        # a carrier of `shift` whole bins on the replica is a circular shift of its spectrum by
+        # `shift`; the remaining `residual` frequency is wiped off the data instead. Blocks are
+        # summed first since the correlation is linear.
+        block_sum = npsum(blocks, axis=0)
+        conjugate_fft = replica_cache.conjugate_spectrum(signal, f_samp, self.num_block_samples)
+        bin_width = self.source.f_samp / self.num_block_samples
+        shifts = numpy.round((f_inter + asarray(self.dopp_bins)) / bin_width).astype(int)
+        residuals = f_inter + asarray(self.dopp_bins) - shifts * bin_width
+        last_residual = None
+        for i, (shift, residual) in enumerate(zip(shifts, residuals)):
+            if residual != last_residual:
+                fft_sum = fft(block_sum * CarrierNCO(f_samp, residual).samples(self.num_block_samples, -1))
+                last_residual = residual
+            yield i, ifft(numpy.roll(conjugate_fft, shift) * fft_sum) / self.num_blocks
         
     def acquire(self, signal, time=None):
         # correlate
         samples, self.time = self.source.get(self.num_samples, time)
-        fft_blocks = fft(samples[:self.num_samples].reshape((self.num_blocks, self.num_block_samples)), axis=1)
-        indices = (floor(self.t * signal.code.rate) % len(signal.code.sequence)).astype(int)
-        code_samples = 1. - 2. * signal.code.sequence[indices]
-        f_inter = signal.f_carrier - self.source.f_center
-        for i, f_dopp in enumerate(self.dopp_bins):
-            reference = code_samples * exp(2j * pi * (f_inter + f_dopp) * self.t)
-            conjugate_fft = conj(fft(reference))
-            self.correlation[i, :] = npsum(ifft(conjugate_fft * fft_blocks), axis=0) / self.num_blocks
+        for i, correlation in self.correlations(signal, samples):
+            self.correlation[i, :] = correlation
         # perform search
         nsc = int(signal.code.length * self.source.f_samp / signal.code.rate)  # number of samples in one code period
         abs_corr = absolute(self.correlation[:, :nsc])
@@ -62,7 +142,11 @@ class CoarseAcquirer:
 # Noise equiv bw is just 1/T and cn0 = snr + bw(in db) so that really long integration times are effectively just the ratio snr
 class CoarseAcquirerLowMem(CoarseAcquirer):
     
-    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000):
+    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000,
+                 dopp_search='replica'):
+        if dopp_search not in ('replica', 'shift'):
+            raise ValueError('`dopp_search` must be one of \'replica\' or \'shift\'')
+        self.dopp_search = dopp_search
         self.block_length = block_length
         self.num_blocks = num_blocks   
         if dopp_bins is None:
@@ -70,7 +154,7 @@ class CoarseAcquirerLowMem(CoarseAcquirer):
         else:
             self.dopp_bins = dopp_bins
         self.source = source
-        self.num_block_samples = self.block_length * source.f_samp
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
         self.num_samples = self.num_blocks * self.num_block_samples
         self.t = arange(self.num_block_samples) / source.f_samp
         self.time = None
@@ -78,17 +162,11 @@ class CoarseAcquirerLowMem(CoarseAcquirer):
     def acquire(self, signal, time=None):
         # correlate
         samples, self.time = self.source.get(self.num_samples, time)
-        fft_blocks = fft(samples[:self.num_samples].reshape((self.num_blocks, self.num_block_samples)), axis=1)
-        indices = (floor(self.t * signal.code.rate) % len(signal.code.sequence)).astype(int)
-        code_samples = 1. - 2. * signal.code.sequence[indices]
-        f_inter = signal.f_carrier - self.source.f_center
         corr_max = zeros((len(self.dopp_bins),))  # value
         n0 = zeros((len(self.dopp_bins),))  # n0
         corr_std = corr_var = 0.
-        for i, f_dopp in enumerate(self.dopp_bins):
-            reference = code_samples * exp(2j * pi * (f_inter + f_dopp) * self.t)
-            conjugate_fft = conj(fft(reference))
-            correlation = absolute(npsum(ifft(conjugate_fft * fft_blocks), axis=0)) / self.num_blocks
+        for i, correlation in self.correlations(signal, samples):
+            correlation = absolute(correlation)
             corr_max[i] = npmax(correlation)  # value
             n0[i] = argmax(correlation)  # n0
             corr_std += std(correlation)
@@ -105,4 +183,374 @@ class CoarseAcquirerLowMem(CoarseAcquirer):
         self.snr = 10 * log((corr_max[dopp_bin] - 1.) / corr_std)        
         
         # for plotting later
-        self.corr_max = corr_max
\ No newline at end of file
+        self.corr_max = corr_max
+
+
+CANDIDATE_DTYPE = numpy.dtype([('dopp_bin', int), ('f_dopp', float), ('n0', int), ('chip', float), ('corr', float),
+                               ('snr', float)])
+
+
+class CoarseAcquirerStreaming(CoarseAcquirer):
+    """
+    Coarse acquisition in bounded memory.
+
+    Correlation magnitudes are computed a chunk of Doppler bins at a time, with the
+    chunk sized so that it, the plot window history and the FFT workspace fit in
+    `memory_budget` bytes however large the search space is. From each chunk only the
+    following is kept:
+
+    - the `num_candidates` strongest distinct peaks, in `candidates` (a `CANDIDATE_DTYPE`
+      array, strongest first). Peaks within one chip in code phase and `1 / block_length`
+      in Doppler of a stronger peak are taken to be part of it
+    - the running mean and variance of all correlation magnitudes (Welford), used as
+      the noise floor for `snr`
+    - the peak of every Doppler bin, in `corr_max`
+    - if `plot_width` is nonzero, the `plot_bins` Doppler bins either side of the best
+      peak by `plot_width` code phase samples, in `plot_corr`, for
+      `plot_coarse_acquisition_results`
+
+    `f_dopp`, `chip`, `n0` and `snr` are those of the strongest candidate.
+    """
+
+    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000,
+                 dopp_search='shift', num_candidates=5, memory_budget=2**26, plot_width=300, plot_bins=10):
+        if dopp_search not in ('replica', 'shift'):
+            raise ValueError('`dopp_search` must be one of \'replica\' or \'shift\'')
+        self.dopp_search = dopp_search
+        self.block_length = block_length
+        self.num_blocks = num_blocks
+        if dopp_bins is None:
+            self.dopp_bins = arange(dopp_min, dopp_max, 1. / block_length)
+        else:
+            self.dopp_bins = asarray(dopp_bins)
+        self.source = source
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
+        self.num_samples = self.num_blocks * self.num_block_samples
+        self.t = arange(self.num_block_samples) / source.f_samp
+        self.time = None
+        self.num_candidates = num_candidates
+        self.memory_budget = memory_budget
+        self.plot_width = plot_width
+        self.plot_bins = plot_bins if plot_width else 0
+        bin_spacing = numpy.median(absolute(numpy.diff(self.dopp_bins))) if len(self.dopp_bins) > 1 else 0.
+        self.dopp_separation = max(1, int(round(1. / (self.block_length * bin_spacing)))) if bin_spacing else 1
+        self.candidates = None
+        self.corr_max = None
+        self.plot_corr = None
+        self.plot_code_window = None
+        self.plot_dopp_window = None
+
+    def chunk_bins(self, nsc):
+        """
+        Returns the number of Doppler bins per chunk for `nsc` code phase samples per bin.
+        """
+        row_size = 4 * nsc  # float32 magnitudes
+        workspace = 64 * self.num_block_samples  # complex128 FFT buffers in `correlations`
+        num_rows = (self.memory_budget - workspace) // row_size - self.plot_bins
+        return int(min(len(self.dopp_bins), max(1, num_rows)))
+
+    def acquire(self, signal, time=None):
+        samples, self.time = self.source.get(self.num_samples, time)
+        self.nsc = nsc = min(int(signal.code.length * self.source.f_samp / signal.code.rate), self.num_block_samples)
+        self.code_separation = max(1, int(self.source.f_samp / signal.code.rate))  # samples per chip
+        num_bins = len(self.dopp_bins)
+        chunk = zeros((self.chunk_bins(nsc), nsc), dtype=float32)
+        self.history = zeros((self.plot_bins, nsc), dtype=float32)
+        self.candidates = zeros((0,), dtype=CANDIDATE_DTYPE)
+        self.corr_max = zeros((num_bins,))
+        self.count, self.corr_mean, self.corr_m2 = 0, 0., 0.
+        self.plot_corr = None
+        start = 0
+        for i, correlation in self.correlations(signal, samples):
+            absolute(correlation[:nsc], out=chunk[i - start], casting='same_kind')
+            if i + 1 - start == len(chunk) or i == num_bins - 1:
+                self.process_chunk(chunk[:i + 1 - start], start)
+                start = i + 1
+        corr_std = sqrt(self.corr_m2 / self.count)
+        samples_per_code = int(signal.code.length * self.source.f_samp / signal.code.rate)
+        self.candidates['chip'] = (1. - self.candidates['n0'] / samples_per_code) * len(signal.code.sequence)
+        self.candidates['snr'] = 10 * log((self.candidates['corr'] - self.corr_mean) / corr_std)
+        best = self.candidates[0]
+        self.f_dopp, self.n0, self.chip, self.snr = best['f_dopp'], best['n0'], best['chip'], best['snr']
+        if self.plot_corr is not None:
+            self.plot_corr /= self.corr_mean
+        del self.history
+
+    def process_chunk(self, rows, start):
+        """
+        Folds the correlation magnitudes `rows` of Doppler bins `start` onward into the
+        candidates, noise statistics and plot window. `rows` is overwritten.
+        """
+        stop = start + len(rows)
+        self.corr_max[start:stop] = rows.max(axis=1)
+        for row in rows:
+            # Welford's update, merging one Doppler bin at a time
+            count = len(row)
+            delta = row.mean(dtype=float) - self.corr_mean
+            total = self.count + count
+            self.corr_mean += delta * count / total
+            self.corr_m2 += row.var(dtype=float) * count + delta**2 * self.count * count / total
+            self.count = total
+        if self.plot_width:
+            self.update_plot_window(rows, start)
+        found = []
+        for k in range(self.num_candidates):
+            r, n = unravel_index(rows.argmax(), rows.shape)
+            if rows[r, n] <= 0.:
+                break
+            found.append((start + r, self.dopp_bins[start + r], n, 0., rows[r, n], 0.))
+            self.suppress(rows, r, n)
+        merged = concatenate((self.candidates, array(found, dtype=CANDIDATE_DTYPE)))
+        merged = merged[argsort(-merged['corr'], kind='stable')]
+        kept = []
+        for candidate in merged:
+            if len(kept) == self.num_candidates:
+                break
+            if not any(self.same_peak(candidate, other) for other in kept):
+                kept.append(candidate)
+        self.candidates = array(kept, dtype=CANDIDATE_DTYPE)
+
+    def suppress(self, rows, r, n):
+        """
+        Zeroes the cells of `rows` belonging to the peak at bin `r`, code phase `n`.
+        """
+        phases = arange(n - self.code_separation, n + self.code_separation + 1) % self.nsc
+        rows[max(0, r - self.dopp_separation):r + self.dopp_separation + 1, phases] = 0.
+
+    def same_peak(self, a, b):
+        code_distance = abs(int(a['n0']) - int(b['n0']))
+        code_distance = min(code_distance, self.nsc - code_distance)
+        return abs(int(a['dopp_bin']) - int(b['dopp_bin'])) <= self.dopp_separation \
+            and code_distance <= self.code_separation
+
+    def update_plot_window(self, rows, start):
+        """
+        Keeps `plot_corr` cropped around the strongest peak seen so far, taking earlier
+        Doppler bins from `history` and filling later ones as their chunks arrive.
+        """
+        stop = start + len(rows)
+        if self.plot_corr is not None and self.plot_fill < self.plot_dopp_window[1]:
+            (b1, b2), (c1, c2) = self.plot_dopp_window, self.plot_code_window
+            fill = min(b2, stop)
+            self.plot_corr[self.plot_fill - b1:fill - b1] = rows[self.plot_fill - start:fill - start, c1:c2]
+            self.plot_fill = fill
+        r, n = unravel_index(rows.argmax(), rows.shape)
+        if len(self.candidates) == 0 or rows[r, n] > self.candidates['corr'][0]:
+            b = start + r
+            b1, b2 = int(max(0, b - self.plot_bins)), int(min(len(self.dopp_bins), b + self.plot_bins + 1))
+            c1 = int(max(0, n - self.plot_width // 2))
+            c2 = min(self.nsc, c1 + self.plot_width)
+            self.plot_corr = zeros((b2 - b1, c2 - c1), dtype=float32)
+            if b1 < start:
+                self.plot_corr[:start - b1] = self.history[len(self.history) - (start - b1):, c1:c2]
+            fill = min(b2, stop)
+            self.plot_corr[max(b1, start) - b1:fill - b1] = rows[max(b1, start) - start:fill - start, c1:c2]
+            self.plot_fill = fill
+            self.plot_dopp_window, self.plot_code_window = (b1, b2), (c1, c2)
+        if len(rows) >= len(self.history):
+            self.history[:] = rows[len(rows) - len(self.history):]
+        else:
+            self.history[:-len(rows)] = self.history[len(rows):]
+            self.history[-len(rows):] = rows
+
+
+class CoarseAcquirerHierarchical(CoarseAcquirer):
+    """
+    Coarse acquisition in stages of increasing coherent block length.
+
+    The samples for the longest block in `block_lengths` are fetched once and
+    reused by every stage:
+
+    1. the first stage searches `dopp_min..dopp_max` at `1 / block_lengths[0]`
+       spacing over all code phases, summing correlation magnitudes non-coherently
+       over consecutive `block_lengths[0]` blocks, and keeps the `num_candidates`
+       strongest distinct peaks
+    2. every later stage correlates coherently over `block_lengths[k]`, only within
+       `code_window` samples and half a previous-stage bin of each candidate, at
+       `1 / block_lengths[k]` spacing. The samples are despread at each candidate
+       code phase and summed over short sub-intervals, so all the Doppler bins of
+       a code phase come from one small matrix product instead of an FFT each.
+
+    `f_dopp`, `chip`, `n0` and `snr` are those of the strongest candidate after the
+    last stage, with `snr` measured against `num_noise_phases` code phases away
+    from it; `candidates` (a `CANDIDATE_DTYPE` array, strongest first, `dopp_bin`
+    being the first-stage bin) holds all refined candidates.
+    """
+
+    def __init__(self, source, block_lengths=(.001, .004, .016), dopp_min=-5000, dopp_max=5000, num_candidates=3,
+                 code_window=2, num_noise_phases=32):
+        self.source = source
+        self.block_lengths = block_lengths
+        self.block_length = block_lengths[-1]
+        self.dopp_bins = arange(dopp_min, dopp_max, 1. / block_lengths[0])
+        self.num_candidates = num_candidates
+        self.code_window = code_window
+        self.num_noise_phases = num_noise_phases
+        self.num_samples = int(round(self.block_length * source.f_samp))
+        self.time = None
+        self.candidates = None
+
+    def acquire(self, signal, time=None):
+        samples, self.time = self.source.get(self.num_samples, time)
+        samples = samples[:self.num_samples]
+        self.samples_per_code = int(signal.code.length * self.source.f_samp / signal.code.rate)
+        corr, f_dopp, n0 = self.search(signal, samples)
+        for k in range(1, len(self.block_lengths)):
+            num_samples = int(round(self.block_lengths[k] * self.source.f_samp))
+            for candidate in range(len(f_dopp)):
+                corr[candidate], f_dopp[candidate], n0[candidate], noise = self.refine(
+                    signal, samples[:num_samples], f_dopp[candidate], n0[candidate], self.block_lengths[k - 1],
+                    self.block_lengths[k], k == len(self.block_lengths) - 1)
+                if k == len(self.block_lengths) - 1:
+                    self.candidates['snr'][candidate] = 10 * log((corr[candidate] - noise.mean()) / noise.std())
+        self.candidates['f_dopp'], self.candidates['n0'], self.candidates['corr'] = f_dopp, n0, corr
+        self.candidates['chip'] = (1. - self.candidates['n0'] / self.samples_per_code) * len(signal.code.sequence)
+        self.candidates = self.candidates[argsort(-self.candidates['corr'], kind='stable')]
+        best = self.candidates[0]
+        self.f_dopp, self.n0, self.chip, self.snr = best['f_dopp'], best['n0'], best['chip'], best['snr']
+
+    def search(self, signal, samples):
+        """
+        First stage: non-coherent full search with the shortest blocks. Returns the
+        candidates' correlation, Doppler and code phase.
+        """
+        acquirer = CoarseAcquirerLowMem(self.source, self.block_lengths[0], 1, dopp_bins=self.dopp_bins,
+                                        dopp_search='shift')
+        n = acquirer.num_block_samples
+        nsc = min(self.samples_per_code, n)
+        corr = zeros((len(self.dopp_bins), nsc))
+        for b in range(len(samples) // n):
+            for i, correlation in acquirer.correlations(signal, samples[b * n:(b + 1) * n]):
+                corr[i] += absolute(correlation[:nsc])
+        if len(self.block_lengths) == 1:
+            noise = corr.ravel()
+        self.candidates = zeros((self.num_candidates,), dtype=CANDIDATE_DTYPE)
+        code_separation = max(1, int(self.source.f_samp / signal.code.rate))
+        for k in range(self.num_candidates):
+            i, n0 = unravel_index(corr.argmax(), corr.shape)
+            self.candidates[k] = (i, self.dopp_bins[i], n0, 0., corr[i, n0], 0.)
+            phases = arange(n0 - code_separation, n0 + code_separation + 1) % nsc
+            corr[max(0, i - 1):i + 2, phases] = 0.
+        if len(self.block_lengths) == 1:
+            self.candidates['snr'] = 10 * log((self.candidates['corr'] - noise.mean()) / noise.std())
+        return self.candidates['corr'].copy(), self.candidates['f_dopp'].copy(), self.candidates['n0'].copy()
+
+    def refine(self, signal, samples, f_dopp, n0, previous_block_length, block_length, measure_noise):
+        """
+        Searches coherently over `samples` around one candidate and returns its
+        refined correlation, Doppler and code phase, and, if `measure_noise`, the
+        correlation magnitudes at code phases away from it.
+        """
+        f_samp = self.source.f_samp
+        num_offsets = int(numpy.ceil(block_length / (2 * previous_block_length))) + 1
+        dopp_offsets = arange(-num_offsets, num_offsets + 1) / block_length
+        wiped = samples * CarrierNCO(f_samp, signal.f_carrier - self.source.f_center + f_dopp).samples(len(samples), -1)
+        phases = arange(n0 - self.code_window, n0 + self.code_window + 1)
+        corr = partial_correlation(wiped, f_samp, signal, f_dopp, phases, self.samples_per_code, dopp_offsets)
+        p, i = unravel_index(corr.argmax(), corr.shape)
+        noise = None
+        if measure_noise:
+            phases = noise_phases(phases[p], self.samples_per_code, self.num_noise_phases,
+                                  max(1, int(f_samp / signal.code.rate)))
+            noise = partial_correlation(wiped, f_samp, signal, f_dopp, phases, self.samples_per_code, dopp_offsets)
+        return corr[p, i], f_dopp + dopp_offsets[i], (n0 - self.code_window + p) % self.samples_per_code, noise
+
+
+ACQUISITION_RESULT_DTYPE = numpy.dtype([('svid', int), ('signal_type', 'U16'), ('f_dopp', float), ('chip', float),
+                                       ('n0', int), ('snr', float), ('cn0', float)])
+
+
+class CoarseAcquirerBatch:
+    """
+    Coarse acquisition of many signals in one pass, e.g. a cold start search over all PRNs.
+
+    The samples are fetched once and, per Doppler bin, carrier wiped, summed over
+    blocks and FFT'd once for all signals sharing a carrier frequency and code
+    rate/length. The code replica spectra of those signals are stacked into one 2-D
+    array, and the correlation, peak search and noise statistics run as batched array
+    operations over (Doppler bin, signal, code phase), at most `batch_size` correlation
+    samples at a time.
+
+    The carrier is wiped continuously across blocks, so the blocks add up coherently
+    over `num_blocks * block_length` and the default Doppler bins are spaced
+    `1 / (num_blocks * block_length)` apart.
+
+    `acquire` returns an `ACQUISITION_RESULT_DTYPE` array with one record per signal,
+    whose `f_dopp`, `chip`, `snr` and `cn0` are defined as for `CoarseAcquirer`.
+    `corr_max` holds the correlation peak of every signal in every Doppler bin.
+    """
+
+    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000,
+                 batch_size=2**22):
+        self.block_length = block_length
+        self.num_blocks = num_blocks
+        if dopp_bins is None:
+            self.dopp_bins = arange(dopp_min, dopp_max, 1. / (num_blocks * block_length))
+        else:
+            self.dopp_bins = asarray(dopp_bins)
+        self.batch_size = batch_size
+        self.source = source
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
+        self.num_samples = self.num_blocks * self.num_block_samples
+        self.t = arange(self.num_block_samples) / source.f_samp
+        self.time = None
+        self.results = None
+        self.corr_max = None
+
+    def acquire(self, signals, time=None):
+        samples, self.time = self.source.get(self.num_samples, time)
+        blocks = samples[:self.num_samples].reshape((self.num_blocks, self.num_block_samples))
+        self.results = zeros((len(signals),), dtype=ACQUISITION_RESULT_DTYPE)
+        self.corr_max = zeros((len(signals), len(self.dopp_bins)))
+        groups = OrderedDict()
+        for i, signal in enumerate(signals):
+            groups.setdefault((signal.f_carrier, signal.code.rate, signal.code.length), []).append(i)
+        for rows in groups.values():
+            self.acquire_group([signals[i] for i in rows], rows, blocks)
+        return self.results
+
+    def acquire_group(self, signals, rows, blocks):
+        """
+        Searches `signals`, which share carrier frequency and code rate/length, and
+        stores their results in `rows` of `results` and `corr_max`.
+        """
+        code = signals[0].code
+        conjugate_ffts = vstack([replica_cache.conjugate_spectrum(signal, self.source.f_samp, self.num_block_samples)
+                                 for signal in signals])
+        f_inter = signals[0].f_carrier - self.source.f_center
+        nsc = int(code.length * self.source.f_samp / code.rate)  # number of samples in one code period
+        num_signals, num_bins = len(signals), len(self.dopp_bins)
+        corr_max = zeros((num_signals, num_bins))
+        n0 = zeros((num_signals, num_bins), dtype=int)
+        corr_sum = zeros((num_signals,))
+        corr_sum_sq = zeros((num_signals,))
+        block_starts = arange(self.num_blocks) * self.block_length
+        bins_per_batch = max(1, self.batch_size // (num_signals * self.num_block_samples))
+        for start in range(0, num_bins, bins_per_batch):
+            f_dopp = self.dopp_bins[start:start + bins_per_batch]
+            # blocks are summed coherently after correlation, and the correlation is linear, so the
+            # blocks are carrier wiped (continuously across blocks) and summed before the FFT
+            block_sum = exp(-2j * pi * outer(f_inter + f_dopp, block_starts)).dot(blocks)
+            fft_mixed = fft(block_sum * carrier_replicas(self.source.f_samp, f_inter + f_dopp, self.num_block_samples, sign=-1), axis=1)
+            correlation = ifft(fft_mixed[:, None, :] * conjugate_ffts[None, :, :], axis=2)[:, :, :nsc]
+            abs_corr = absolute(correlation) / self.num_blocks  # (bin, signal, code phase)
+            corr_max[:, start:start + len(f_dopp)] = abs_corr.max(axis=2).T
+            n0[:, start:start + len(f_dopp)] = abs_corr.argmax(axis=2).T
+            corr_sum += abs_corr.sum(axis=(0, 2))
+            corr_sum_sq += (abs_corr**2).sum(axis=(0, 2))
+        # same statistic as `CoarseAcquirer`: peak over noise after normalizing by the mean
+        count = num_bins * abs_corr.shape[2]
+        corr_mean = corr_sum / count
+        corr_std = sqrt(corr_sum_sq / count - corr_mean**2)
+        dopp_bin = corr_max.argmax(axis=1)
+        peak = corr_max[arange(num_signals), dopp_bin]
+        results = self.results[rows]
+        results['svid'] = [signal.svid for signal in signals]
+        results['signal_type'] = [signal.signal_type for signal in signals]
+        results['f_dopp'] = self.dopp_bins[dopp_bin]
+        results['n0'] = n0[arange(num_signals), dopp_bin]
+        results['chip'] = (1. - results['n0'] / nsc) * code.length
+        results['snr'] = 10 * log((peak - corr_mean) / corr_std)
+        results['cn0'] = results['snr'] + 10 * log(1 / self.block_length)
+        self.results[rows] = results
+        self.corr_max[rows] = corr_max
@@ -1,48 +1,107 @@
 
 
-
 import numpy
+from gnss.signals.replicas import sample_code
+from gnss.signals.nco import carrier_replicas
+
+FINE_ACQUISITION_RESULT_DTYPE = numpy.dtype([('svid', int), ('signal_type', 'U16'), ('f_dopp', float), ('chip', float),
+                                             ('phase', float), ('residual', float)])
 
 
 class FineAcquirer:
-    
+    """
+    Refines the Doppler of coarse acquisition results from the carrier phase of
+    `num_blocks` blocks of `block_length` seconds, starting `separation_length`
+    seconds apart (blocks may overlap).
+
+    The block phases are unwrapped and a line is fit to them by least squares,
+    weighted by block power, so weak (noisy) blocks count less. Unwrapping assumes
+    the remaining Doppler error is below `1 / (2 * separation_length)`. `residual` is
+    the weighted RMS phase residual of the fit (radians): a few hundredths for a
+    strong carrier, tenths or more for noise or a false detection.
+
+    `acquire_many` refines many candidates at once, at most `batch_size` samples
+    of replicas at a time; `acquire` refines one and keeps its block `phases`.
+    """
+
     # when acquire, call next block on source, get and store acquisition start time as acquisition epoch
-    
-    def __init__(self, source, block_length, separation_length, num_blocks):
+
+    def __init__(self, source, block_length, separation_length, num_blocks, batch_size=2**22):
         self.source = source
         self.block_length = block_length
         self.separation_length = separation_length
         self.num_blocks = num_blocks
-        self.num_block_samples = self.block_length * source.f_samp
-        self.num_sep_samples = self.separation_length * source.f_samp
-        self.num_samples = self.num_blocks * self.num_sep_samples + self.num_block_samples
-        self.phases = numpy.zeros((self.num_blocks,), dtype=numpy.complex)
+        self.batch_size = batch_size
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
+        self.num_sep_samples = int(round(self.separation_length * source.f_samp))
+        self.num_samples = (self.num_blocks - 1) * self.num_sep_samples + self.num_block_samples
+        self.phases = numpy.zeros((self.num_blocks,), dtype=complex)
         self.t = numpy.arange(self.num_samples) / source.f_samp
-    
+        self.starts = numpy.arange(self.num_blocks) * self.num_sep_samples
+        self.block_times = (self.starts + self.num_block_samples / 2.) / source.f_samp
+        self.time = None
+        self.results = None
+
     def acquire(self, signal, time, chip, f_dopp):
         # time is the time of acquisition of parameters chip and f_dopp
-        # TODO come up with a better way to pass these parameters
-        # doppler adjusted chipping rate
-        f_chip = signal.code.rate * (1 + f_dopp / signal.f_carrier)
-        # intermediate frequency for signal
-        f_inter = signal.f_carrier - self.source.f_center
-        # get signal samples and correct for quantization
+        self.acquire_many([signal], time, [chip], [f_dopp])
+        self.phases = self.block_phases[0]
+        self.f_dopp = self.results['f_dopp'][0]
+        self.residual = self.results['residual'][0]
+
+    def acquire_many(self, signals, time, chips, f_dopps):
+        """
+        Refines the Doppler `f_dopps` of `signals` found at code phases `chips` at
+        `time`, e.g. the `chip` and `f_dopp` fields of an `ACQUISITION_RESULT_DTYPE`
+        array, and returns a `FINE_ACQUISITION_RESULT_DTYPE` array with the refined
+        Doppler, the code phase and fitted carrier phase (radians) at the first
+        sample and the fit residual. `block_phases` holds the (candidate, block)
+        block correlations.
+        """
         samples, self.time = self.source.get(self.num_samples, time)
-        # correct for any time quantization
-        chip += (self.time - time) * f_chip
-        # generate code samples
-        indices = (numpy.floor(chip + self.t * f_chip) % len(signal.code.sequence)).astype(int)
-        code_samples = 1. - 2. * signal.code.sequence[indices]
-        # generate reference and clean signal
-        conjugate_reference = code_samples * numpy.exp(-2j * numpy.pi * (f_inter + f_dopp) * self.t)
-        clean_signal = conjugate_reference * samples
-        # sum and store phases
-        for i in range(self.num_blocks):
-            self.phases[i] = numpy.sum(clean_signal[i * self.num_sep_samples:i * self.num_sep_samples + self.num_block_samples])
-        d_angles = numpy.angle(self.phases[1:] / self.phases[:-1])
-        indices = numpy.where((d_angles - d_angles.mean())**2 < d_angles.var())[0]
-        slope = numpy.mean(d_angles[indices])
-        delta_f_dopp = slope / (self.separation_length * 2 * numpy.pi)
-        self.f_dopp = f_dopp + delta_f_dopp
-        
-        
\ No newline at end of file
+        samples = samples[:self.num_samples]
+        chips, f_dopps = numpy.asarray(chips, dtype=float), numpy.asarray(f_dopps, dtype=float)
+        # doppler adjusted chipping rates, correcting the code phases for any time quantization
+        f_chips = numpy.asarray([signal.code.rate * (1 + f_dopp / signal.f_carrier) for signal, f_dopp in zip(signals, f_dopps)])
+        chips = chips + (self.time - time) * f_chips
+        self.block_phases = numpy.zeros((len(signals), self.num_blocks), dtype=complex)
+        batch = max(1, self.batch_size // self.num_samples)
+        for start in range(0, len(signals), batch):
+            rows = range(start, min(len(signals), start + batch))
+            # one row per candidate: the conjugate code and carrier replica
+            f_inter = numpy.asarray([signals[i].f_carrier - self.source.f_center + f_dopps[i] for i in rows])
+            replicas = carrier_replicas(self.source.f_samp, f_inter, self.num_samples, sign=-1)
+            replicas *= [sample_code(signals[i], self.source.f_samp, self.num_samples, f_dopps[i], chips[i])
+                         for i in rows]
+            replicas *= samples
+            # block sums as differences of running sums, so blocks may overlap, touch or
+            # leave gaps; accumulated in double precision over the whole span
+            sums = numpy.zeros((len(rows), self.num_samples + 1), dtype=complex)
+            numpy.cumsum(replicas, axis=1, out=sums[:, 1:])
+            self.block_phases[rows] = sums[:, self.starts + self.num_block_samples] - sums[:, self.starts]
+        slope, phase, residual = self.fit_phases(self.block_phases)
+        self.results = numpy.zeros((len(signals),), dtype=FINE_ACQUISITION_RESULT_DTYPE)
+        self.results['svid'] = [signal.svid for signal in signals]
+        self.results['signal_type'] = [signal.signal_type for signal in signals]
+        self.results['f_dopp'] = f_dopps + slope / (2 * numpy.pi)
+        self.results['chip'] = chips
+        self.results['phase'] = phase
+        self.results['residual'] = residual
+        return self.results
+
+    def fit_phases(self, block_phases):
+        """
+        Fits `phase + slope * t` to the unwrapped angles of every row of
+        `block_phases` at `block_times`, weighted by block power, and returns
+        `(slope, phase, residual)` per row.
+        """
+        angles = numpy.unwrap(numpy.angle(block_phases), axis=1)
+        weights = numpy.absolute(block_phases)**2
+        weights /= weights.sum(axis=1, keepdims=True)
+        t_mean = weights.dot(self.block_times)
+        angle_mean = (weights * angles).sum(axis=1)
+        dt = self.block_times[None, :] - t_mean[:, None]
+        slope = (weights * dt * (angles - angle_mean[:, None])).sum(axis=1) / (weights * dt**2).sum(axis=1)
+        errors = angles - angle_mean[:, None] - slope[:, None] * dt
+        residual = numpy.sqrt((weights * errors**2).sum(axis=1))
+        return slope, angle_mean - slope * t_mean, residual
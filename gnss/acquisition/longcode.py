@@ -0,0 +1,214 @@
+"""
+Acquisition of codes longer than a practical FFT block: L2C (CM and CL chips
+time-multiplexed, a 1.5 s period) and L5 (a 1 ms primary code with a
+Neuman-Hofman overlay).
+
+`LongCodeAcquirer` searches the short primary code of such a signal with
+zero-padded FFT correlation of overlapping two-epoch segments, so every code
+phase correlates over exactly one primary epoch and overlay or data transitions
+never fall inside a correlation. The primary-epoch correlations are then combined
+coherently under every overlay alignment hypothesis and, for L2C, the CM-only
+result is extended to the full code phase by testing the CL code at every CM
+epoch of the CL period.
+"""
+
+import numpy
+from numpy import arange, zeros, ones, exp, pi, absolute, log, conj, unravel_index, asarray
+from numpy.lib.stride_tricks import sliding_window_view
+from gnss.signals import Signal
+from gnss.signals.replicas import replica_cache
+from gnss.signals.nco import CarrierNCO
+from gnss.acquisition.coarse import partial_correlation
+fft = numpy.fft.fft
+ifft = numpy.fft.ifft
+
+# primary code lengths (chips) of long codes; for time-multiplexed codes the primary
+# code is the first component (CM for L2C) over one of its periods
+PRIMARY_CODE_LENGTHS = {'GPSL2C': 20460, 'GPSL5I': 10230, 'GPSL5Q': 10230}
+TIME_MULTIPLEXED = ('GPSL2C',)
+
+
+def component_signal(signal, slot, length, suffix):
+    """
+    Returns a signal whose code keeps the time-multiplexed chips of `signal` in
+    `slot` (0 or 1) over the first `length` chips. The chips of the other component
+    are set to 1/2, which sample to zero, so they neither add to nor disturb the
+    correlation.
+    """
+    sequence = signal.code.sequence[:length].astype(float)
+    sequence[1 - slot::2] = .5
+    code = signal.code.__class__(sequence, signal.code.rate)
+    return Signal(signal.svid, signal.f_carrier, code, signal_type=signal.signal_type + suffix)
+
+
+def long_code_components(signal):
+    """
+    Splits the code of `signal` into `(primary, secondary, resolver)`: the signal of
+    the primary code searched by FFT, the +/-1 overlay sequence over successive
+    primary epochs, and the signal (or `None`) whose correlation at every primary
+    epoch of the full period resolves the remaining ambiguity.
+
+    Codes not in `PRIMARY_CODE_LENGTHS` are searched over their full period.
+    """
+    primary_length = PRIMARY_CODE_LENGTHS.get(signal.signal_type, signal.code.length)
+    if signal.signal_type in TIME_MULTIPLEXED:
+        primary = component_signal(signal, 0, primary_length, '-primary')
+        resolver = component_signal(signal, 1, signal.code.length, '-resolver')
+        return primary, ones((1,)), resolver
+    epochs = signal.code.sequence.reshape((-1, primary_length))
+    # epoch k is the primary code modulo-2 summed with overlay chip k, relative to epoch 0
+    overlay = (epochs[:, 0] != epochs[0, 0])
+    if not (epochs == (epochs[0] + overlay[:, None]) % 2).all():
+        raise ValueError('code of {0} is not an overlaid code of {1} chips'.format(signal.signal_type, primary_length))
+    code = signal.code.__class__(epochs[0], signal.code.rate)
+    primary = Signal(signal.svid, signal.f_carrier, code, signal_type=signal.signal_type + '-primary')
+    return primary, 1. - 2. * overlay, None
+
+
+class LongCodeAcquirer:
+    """
+    Acquisition of long and overlaid codes (see the module docstring).
+
+    The primary code is correlated over `num_blocks` primary epochs, combined
+    coherently under each overlay hypothesis, and `num_sums` such sums are added
+    non-coherently. Data bits are not wiped, so coherent sums of L2C CM (one 20 ms
+    data symbol per CM epoch) should stay at `num_blocks=1`. Doppler bins default to
+    `1 / (num_blocks * primary period)` spacing; each is a shift of the replica
+    spectrum plus a residual wiped off the data, as with `dopp_search='shift'` in
+    `CoarseAcquirer`, and code Doppler is compensated epoch by epoch.
+
+    After `acquire`, `snr` and `cn0` are defined as for `CoarseAcquirer`; `f_dopp` is
+    refined to a quarter bin while rescoring the overlay hypotheses at the peak (see
+    `refine`); `chip` and `n0` are the code phase within the full code period. `epoch` is the
+    primary epoch within the full period the first sample falls in, `corr` the
+    correlation magnitudes as (Doppler bin, primary code phase), maximized over
+    overlay hypotheses, and `resolver_corr` (L2C) the CL correlation at every
+    candidate CM epoch.
+    """
+
+    def __init__(self, source, num_blocks=1, num_sums=1, dopp_bins=None, dopp_min=-5000, dopp_max=5000):
+        self.source = source
+        self.num_blocks = num_blocks
+        self.num_sums = num_sums
+        self.requested_dopp_bins = dopp_bins
+        self.dopp_bins = None
+        self.dopp_min = dopp_min
+        self.dopp_max = dopp_max
+        self.time = None
+        self.corr = None
+        self.resolver_corr = None
+
+    @property
+    def cn0(self):
+        return self.snr + 10 * log(1 / self.block_length)
+
+    def epoch_correlations(self, primary, samples, num_epochs, num_epoch_samples, dopp_bins=None):
+        """
+        Yields `(i, correlations)` for every Doppler bin `i` (of `dopp_bins`, default
+        `self.dopp_bins`), where row `k` of `correlations` is the linear correlation
+        of the primary code with the samples from epoch `k` on, at code phases
+        `0..num_epoch_samples - 1`.
+        """
+        dopp_bins = self.dopp_bins if dopp_bins is None else dopp_bins
+        f_samp = self.source.f_samp
+        # two epochs, so bins on a `1 / (k * period)` grid share few residuals
+        fft_size = 2 * num_epoch_samples
+        f_inter = primary.f_carrier - self.source.f_center
+        replica = zeros((fft_size,))
+        replica[:num_epoch_samples] = replica_cache.code_samples(primary, f_samp, num_epoch_samples)
+        conjugate_fft = conj(fft(replica))
+        bin_width = f_samp / fft_size
+        shifts = numpy.round((f_inter + dopp_bins) / bin_width).astype(int)
+        residuals = f_inter + dopp_bins - shifts * bin_width
+        epochs = arange(num_epochs)
+        last_residual = None
+        for i, (shift, residual) in enumerate(zip(shifts, residuals)):
+            if residual != last_residual:
+                # the residual is wiped continuously, so epochs stay phase-coherent
+                wiped = samples * CarrierNCO(f_samp, residual).samples(len(samples), -1)
+                segments = sliding_window_view(wiped, fft_size)[::num_epoch_samples][:num_epochs]
+                fft_segments = fft(segments, axis=1)
+                last_residual = residual
+            correlations = ifft(numpy.roll(conjugate_fft, shift) * fft_segments, axis=1)[:, :num_epoch_samples]
+            # the shifted carrier restarts with every segment
+            correlations *= exp(-2j * pi * shift * epochs * num_epoch_samples / fft_size)[:, None]
+            # the code drifts `f_dopp / f_carrier` samples per sample against the segments
+            drift = numpy.round(epochs * num_epoch_samples * dopp_bins[i] / primary.f_carrier).astype(int)
+            for k in numpy.flatnonzero(drift):
+                correlations[k] = numpy.roll(correlations[k], drift[k])
+            yield i, correlations
+
+    def acquire(self, signal, time=None):
+        primary, secondary, resolver = long_code_components(signal)
+        f_samp = self.source.f_samp
+        num_epoch_samples = int(primary.code.length * f_samp / primary.code.rate)
+        period = primary.code.length / primary.code.rate
+        self.block_length = self.num_blocks * period
+        if self.requested_dopp_bins is None:
+            self.dopp_bins = arange(self.dopp_min, self.dopp_max, 1. / self.block_length)
+        else:
+            self.dopp_bins = asarray(self.requested_dopp_bins, dtype=float)
+        num_epochs = self.num_blocks * self.num_sums
+        samples, self.time = self.source.get((num_epochs + 1) * num_epoch_samples, time)
+        samples = samples[:(num_epochs + 1) * num_epoch_samples]
+        # hypothesis `h`: epoch `k` of the samples carries overlay chip `h + k`
+        num_hypotheses = len(secondary)
+        overlay = secondary[(arange(num_hypotheses)[:, None] + arange(num_epochs)[None, :]) % num_hypotheses]
+        self.corr = zeros((len(self.dopp_bins), num_epoch_samples))
+        for i, correlations in self.epoch_correlations(primary, samples, num_epochs, num_epoch_samples):
+            corr = zeros((num_hypotheses, num_epoch_samples))
+            for j in range(self.num_sums):
+                epochs = slice(j * self.num_blocks, (j + 1) * self.num_blocks)
+                corr += absolute(overlay[:, epochs].dot(correlations[epochs]))
+            self.corr[i] = corr.max(axis=0)
+        dopp_bin, n = unravel_index(self.corr.argmax(), self.corr.shape)
+        self.snr = 10 * log((self.corr[dopp_bin, n] - self.corr.mean()) / self.corr.std())
+        self.f_dopp, best = self.refine(primary, samples, overlay, num_epochs, num_epoch_samples, period,
+                                        self.dopp_bins[dopp_bin], n)
+        # the primary epoch starting `n` samples in carries overlay chip `best`
+        chip = (best * primary.code.length - n * primary.code.length / num_epoch_samples) % signal.code.length
+        if resolver is not None:
+            chip = self.resolve(signal, resolver, samples[:num_epochs * num_epoch_samples], chip, primary.code.length)
+        self.chip = chip
+        self.epoch = int(chip // primary.code.length)
+        samples_per_code = int(signal.code.length * f_samp / signal.code.rate)
+        self.n0 = int(round((1. - self.chip / signal.code.length) * samples_per_code)) % samples_per_code
+
+    def refine(self, primary, samples, overlay, num_epochs, num_epoch_samples, period, f_dopp, n, num_offsets=5):
+        """
+        Rescores the overlay hypotheses `overlay` at code phase `n` for `num_offsets`
+        Doppler offsets over +/- half a bin from `f_dopp`, and returns the Doppler and
+        hypothesis that correlate best.
+
+        A Doppler error turns the phase across the epochs of a block, by up to half a
+        cycle at the edge of a bin, which can favour a neighbouring overlay alignment;
+        rotating the epoch correlations back before combining them avoids that.
+        """
+        correlations = next(self.epoch_correlations(primary, samples, num_epochs, num_epoch_samples,
+                                                    numpy.asarray([f_dopp])))[1][:, n]
+        offsets = numpy.linspace(-.5, .5, num_offsets) / self.block_length
+        rotated = correlations[None, :] * exp(-2j * pi * numpy.outer(offsets, arange(num_epochs) * period))
+        corr = zeros((num_offsets, overlay.shape[0]))
+        for j in range(self.num_sums):
+            epochs = slice(j * self.num_blocks, (j + 1) * self.num_blocks)
+            corr += absolute(rotated[:, epochs].dot(overlay[:, epochs].T))
+        offset, best = unravel_index(corr.argmax(), corr.shape)
+        return f_dopp + offsets[offset], best
+
+    def resolve(self, signal, resolver, samples, chip, primary_length):
+        """
+        Correlates `resolver` with `samples` at `chip` plus every whole number of
+        primary periods, searching half a Doppler bin either side of `f_dopp`, and
+        returns the candidate chip with the strongest correlation.
+        """
+        f_samp = self.source.f_samp
+        samples_per_code = int(signal.code.length * f_samp / signal.code.rate)
+        wiped = samples * CarrierNCO(f_samp, signal.f_carrier - self.source.f_center + self.f_dopp).samples(len(samples), -1)
+        dopp_offsets = arange(-2, 3) / (4 * self.block_length)
+        chips = (chip + arange(signal.code.length // primary_length) * primary_length) % signal.code.length
+        self.resolver_corr = zeros((len(chips),))
+        for k, candidate in enumerate(chips):
+            n = int(round((1. - candidate / signal.code.length) * samples_per_code))
+            self.resolver_corr[k] = partial_correlation(wiped, f_samp, resolver, self.f_dopp, [n], samples_per_code,
+                                                        dopp_offsets).max()
+        return chips[self.resolver_corr.argmax()]
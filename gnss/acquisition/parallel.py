@@ -0,0 +1,169 @@
+"""
+Coarse acquisition spread over a pool of worker processes.
+
+`ParallelAcquirer.acquire` splits the search over a list of signals into
+(signal, Doppler sub-range) work units and runs them on a process pool. The
+samples are copied once into shared memory and the signals (whose codes may be
+long, e.g. the L2C CL code) are handed to the workers once when they start, so
+only a signal index, a Doppler sub-range and the per-bin results cross process
+boundaries per unit.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from os import cpu_count
+from numpy import ndarray, zeros, arange, asarray, complex64, sqrt, log
+from gnss.acquisition.coarse import CoarseAcquirerLowMem, ACQUISITION_RESULT_DTYPE
+
+worker_samples = None  # shared sample block, attached in each worker by `attach_worker`
+worker_signals = None  # signals searched by the pool, set in each worker by `attach_worker`
+
+
+class SharedSampleBlock:
+    """
+    Stand-in for the source inside workers: the sample rate, center frequency and
+    the samples in shared memory.
+    """
+
+    def __init__(self, f_samp, f_center, name, num_samples):
+        self.f_samp = f_samp
+        self.f_center = f_center
+        self.name = name
+        self.num_samples = num_samples
+
+
+def attach_worker(block, signals):
+    global worker_samples, worker_signals
+    memory = shared_memory.SharedMemory(name=block.name)
+    worker_samples = (memory, ndarray((block.num_samples,), dtype=complex64, buffer=memory.buf))
+    worker_signals = signals
+
+
+def search_bins(block, block_length, num_blocks, dopp_search, signal_index, dopp_bins):
+    """
+    Searches `dopp_bins` for signal `signal_index` of the worker's signals in the
+    shared samples and returns the correlation peak, its code phase and the mean
+    and variance of the correlation magnitudes of every bin.
+    """
+    signal = worker_signals[signal_index]
+    acquirer = CoarseAcquirerLowMem(block, block_length, num_blocks, dopp_bins=dopp_bins, dopp_search=dopp_search)
+    nsc = min(int(signal.code.length * block.f_samp / signal.code.rate), acquirer.num_block_samples)
+    corr_max, n0 = zeros((len(dopp_bins),)), zeros((len(dopp_bins),), dtype=int)
+    corr_mean, corr_var = zeros((len(dopp_bins),)), zeros((len(dopp_bins),))
+    for i, correlation in acquirer.correlations(signal, worker_samples[1]):
+        correlation = abs(correlation[:nsc])
+        n0[i] = correlation.argmax()
+        corr_max[i] = correlation[n0[i]]
+        corr_mean[i] = correlation.mean()
+        corr_var[i] = correlation.var()
+    return corr_max, n0, corr_mean, corr_var
+
+
+class ParallelAcquirer:
+    """
+    Coarse acquisition of many signals on `num_workers` processes (default: all cores).
+
+    Each signal's Doppler bins are split into sub-ranges of at most `bins_per_unit`
+    bins (default: enough units to give every worker about four) that are searched
+    as in `CoarseAcquirer` with `dopp_search`. The per-bin results are merged in
+    signal and bin order, so results do not depend on the number of workers or
+    the order units complete in.
+
+    `acquire` returns an `ACQUISITION_RESULT_DTYPE` array with one record per signal;
+    `corr_max` holds the correlation peak of every signal in every Doppler bin. The
+    shared memory is kept between calls until `close`, and so is the worker pool
+    while the same signals are searched; a different list of signals restarts the
+    workers with it.
+    """
+
+    def __init__(self, source, block_length, num_blocks, dopp_bins=None, dopp_min=-5000, dopp_max=5000,
+                 dopp_search='shift', num_workers=None, bins_per_unit=None):
+        self.source = source
+        self.block_length = block_length
+        self.num_blocks = num_blocks
+        if dopp_bins is None:
+            self.dopp_bins = arange(dopp_min, dopp_max, 1. / block_length)
+        else:
+            self.dopp_bins = asarray(dopp_bins)
+        self.dopp_search = dopp_search
+        self.num_workers = num_workers or cpu_count()
+        self.bins_per_unit = bins_per_unit
+        self.num_block_samples = int(round(self.block_length * source.f_samp))
+        self.num_samples = self.num_blocks * self.num_block_samples
+        self.time = None
+        self.results = None
+        self.corr_max = None
+        self.memory = None
+        self.executor = None
+        self.signals = None
+
+    def start(self, signals):
+        """
+        Allocates the shared sample block if needed and starts the worker
+        processes for `signals`.
+        """
+        if self.memory is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.num_samples * complex64().itemsize)
+            self.samples = ndarray((self.num_samples,), dtype=complex64, buffer=self.memory.buf)
+            self.block = SharedSampleBlock(self.source.f_samp, self.source.f_center, self.memory.name,
+                                           self.num_samples)
+        self.stop_workers()
+        self.signals = list(signals)
+        self.executor = ProcessPoolExecutor(self.num_workers, initializer=attach_worker,
+                                            initargs=(self.block, self.signals))
+
+    def stop_workers(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.signals = None
+
+    def close(self):
+        self.stop_workers()
+        if self.memory is not None:
+            del self.samples
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def acquire(self, signals, time=None):
+        if self.signals is None or len(signals) != len(self.signals) \
+                or any(signal is not other for signal, other in zip(signals, self.signals)):
+            self.start(signals)
+        samples, self.time = self.source.get(self.num_samples, time)
+        self.samples[:] = samples[:self.num_samples]
+        num_bins = len(self.dopp_bins)
+        bins_per_unit = self.bins_per_unit or max(1, -(-len(signals) * num_bins // (4 * self.num_workers)))
+        units = [(i, start) for i in range(len(signals)) for start in range(0, num_bins, bins_per_unit)]
+        futures = [self.executor.submit(search_bins, self.block, self.block_length, self.num_blocks,
+                                        self.dopp_search, i, self.dopp_bins[start:start + bins_per_unit])
+                   for i, start in units]
+        corr_max, n0 = zeros((len(signals), num_bins)), zeros((len(signals), num_bins), dtype=int)
+        corr_mean, corr_var = zeros((len(signals), num_bins)), zeros((len(signals), num_bins))
+        for (i, start), future in zip(units, futures):
+            stop = min(num_bins, start + bins_per_unit)
+            corr_max[i, start:stop], n0[i, start:stop], corr_mean[i, start:stop], corr_var[i, start:stop] = \
+                future.result()
+        # same statistic as `CoarseAcquirer`; all bins hold the same number of code phases,
+        # so the overall mean and variance follow from the per-bin ones
+        total_mean = corr_mean.mean(axis=1)
+        total_std = sqrt(corr_var.mean(axis=1) + ((corr_mean - total_mean[:, None])**2).mean(axis=1))
+        dopp_bin = corr_max.argmax(axis=1)
+        rows = arange(len(signals))
+        self.corr_max = corr_max
+        self.results = zeros((len(signals),), dtype=ACQUISITION_RESULT_DTYPE)
+        self.results['svid'] = [signal.svid for signal in signals]
+        self.results['signal_type'] = [signal.signal_type for signal in signals]
+        self.results['f_dopp'] = self.dopp_bins[dopp_bin]
+        self.results['n0'] = n0[rows, dopp_bin]
+        nsc = asarray([int(signal.code.length * self.source.f_samp / signal.code.rate) for signal in signals])
+        self.results['chip'] = (1. - self.results['n0'] / nsc) * [signal.code.length for signal in signals]
+        self.results['snr'] = 10 * log((corr_max[rows, dopp_bin] - total_mean) / total_std)
+        self.results['cn0'] = self.results['snr'] + 10 * log(1 / self.block_length)
+        return self.results
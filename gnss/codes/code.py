@@ -1,5 +1,8 @@
 
-from fractions import gcd
+try:
+    from math import gcd
+except ImportError:  # Python 2
+    from fractions import gcd
 from numpy import arange, floor, vstack, asarray, repeat
 
 def lcm(a, b):
@@ -1,2 +1,3 @@
 # init file for filters module
 from gnss.filters.iir_filter import FirstOrderLowpass, SecondOrderLowpass, SecondOrderLowpassV2, IIRFilter
+from gnss.filters.fir_filter import lowpass_taps, PolyphaseDecimator
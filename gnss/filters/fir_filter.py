@@ -0,0 +1,91 @@
+from numpy import arange, asarray, sinc, hamming, zeros, concatenate, convolve, iscomplexobj, float32, complex64
+
+
+def lowpass_taps(num_taps, cutoff):
+    """
+    Designs a windowed-sinc (Hamming) lowpass FIR filter with unity DC gain.
+
+    inputs
+    ------
+
+    num_taps:
+        number of filter coefficients
+    cutoff:
+        cutoff frequency as a fraction of the Nyquist frequency (0 to 1)
+    """
+    n = arange(num_taps) - (num_taps - 1) / 2.
+    taps = cutoff * sinc(cutoff * n) * hamming(num_taps)
+    return taps / taps.sum()
+
+
+class PolyphaseDecimator:
+    """
+    Streaming FIR decimator implemented as a polyphase filter bank.
+
+    Input samples are filtered by `taps` and only every `decimation`-th output
+    sample is computed: the filter is split into `decimation` sub-filters
+    (phases), each running at the output rate on its own stride of the input.
+    The last input samples and the output phase are kept between calls to
+    `process`, so a stream may be decimated in arbitrarily sized pieces.
+
+    The filter is causal: output `k` is the filtered value at input sample
+    `k * decimation`, delayed by the filter group delay `delay` (in input samples).
+
+    A single tap of 1 reduces to plain `samples[::decimation]` decimation.
+
+    Real input is filtered as `float32` and complex input as `complex64`; the kept
+    input samples switch to complex once complex samples arrive.
+    """
+
+    def __init__(self, decimation, taps=None, num_taps=None, cutoff=None):
+        self.decimation = int(decimation)
+        if taps is None:
+            num_taps = num_taps if num_taps else 8 * self.decimation
+            cutoff = cutoff if cutoff else .9 / self.decimation
+            taps = lowpass_taps(num_taps, cutoff)
+        self.taps = asarray(taps, dtype=float32)
+        self.delay = (len(self.taps) - 1) / 2.
+        num_phases = -(-len(self.taps) // self.decimation)
+        padded = zeros((num_phases * self.decimation,), dtype=float32)
+        padded[:len(self.taps)] = self.taps
+        self.phase_taps = [padded[p::self.decimation] for p in range(self.decimation)]
+        self.history_size = len(padded) - 1
+        self.reset()
+
+    def reset(self, history=None):
+        """
+        Clears the filter state. If given, `history` holds the input samples that
+        immediately precede the next call to `process`.
+        """
+        dtype = complex64 if history is not None and iscomplexobj(history) else float32
+        self.history = zeros((self.history_size,), dtype=dtype)
+        if history is not None and self.history_size:
+            history = asarray(history)[-self.history_size:]
+            self.history[len(self.history) - len(history):] = history
+        self.phase = 0
+
+    def process(self, samples):
+        """
+        Filters and decimates the next `samples` of the stream and returns the
+        resulting output samples.
+        """
+        dtype = complex64 if iscomplexobj(samples) or iscomplexobj(self.history) else float32
+        if len(self.taps) == 1:
+            out = self.taps[0] * samples[self.phase::self.decimation]
+            self.phase = (self.phase - len(samples)) % self.decimation
+            return out.astype(dtype)
+        if self.history.dtype != dtype:
+            self.history = self.history.astype(dtype)
+        z = concatenate((self.history, samples))
+        first = self.history_size + self.phase
+        num_out = max(0, -(-(len(z) - first) // self.decimation))
+        num_phase_taps = len(self.phase_taps[0])
+        out = zeros((num_out,), dtype=dtype)
+        if num_out:
+            for p, h in enumerate(self.phase_taps):
+                start = first - p - (num_phase_taps - 1) * self.decimation
+                branch = z[start:start + (num_out + num_phase_taps - 1) * self.decimation:self.decimation]
+                out += convolve(branch, h, 'valid')
+        self.phase = first + num_out * self.decimation - len(z)
+        self.history[:] = z[len(z) - self.history_size:]
+        return out
@@ -1,5 +1,8 @@
 # init file for receiver module
 from gnss.receiver.outputs import TrackingOutputBuffer
-from gnss.receiver.sources import Source, FileSource, FileSource4BitComplexWithMetaData
+from gnss.receiver.sources import Source, FileSource, FileSource4BitComplexWithMetaData, MemoryMappedFileSource, PrefetchingFileSource, RingBufferSource, RingFileSource, MultiFileSource
+from gnss.receiver.channelizer import Channelizer, ChannelizedSource
+from gnss.receiver.chunked import ChunkedFileSource, transcode
+from gnss.receiver.network import NetworkSource, FileReplaySender
 from gnss.receiver.controllers import ChannelController
 from gnss.receiver.channels import SatChannel, SignalChannel
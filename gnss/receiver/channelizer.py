@@ -0,0 +1,112 @@
+from numpy import arange, exp, pi, complex64, multiply, empty
+from gnss.receiver.sources import FileSource, MemoryMappedFileSource, RingBufferSource
+
+
+class ChannelizedSource(RingBufferSource):
+    """
+    Narrowband child stream produced by a `Channelizer`.
+
+    Holds the samples of its parent source shifted from the parent's center
+    frequency to `f_center`, lowpass filtered and decimated by `decimation`.
+    It behaves as a `RingBufferSource` with its own `f_samp` and `f_center`, so
+    it can be handed to acquisition and tracking like any other `Source`.
+    """
+
+    def __init__(self, parent, f_center, decimation, buffer_size, decimation_taps=None, chunk_size=65536):
+        super(ChannelizedSource, self).__init__(parent.f_samp, f_center, buffer_size, parent.bit_depth, False,
+                                                decimation, decimation_taps=decimation_taps)
+        self.f_shift = f_center - parent.f_center
+        self.cycles_per_sample = self.f_shift / parent.f_samp
+        self.phasors = exp(-2j * pi * self.cycles_per_sample * arange(chunk_size)).astype(complex64)
+        self.phase = 0.  # mixer phase (cycles) at the next input sample
+
+    def start(self, parent_index):
+        """
+        Empties the stream and aligns it to begin at parent sample `parent_index`.
+        """
+        index = -(-parent_index // self.decimation)
+        self.reset(index)
+        if self.decimator is not None:
+            self.decimator.reset()
+            self.decimator.phase = index * self.decimation - parent_index
+        self.phase = (self.cycles_per_sample * parent_index) % 1.
+
+    def mix(self, samples, out):
+        """
+        Shifts the next `samples` of the parent stream down by `f_shift` into `out`.
+        """
+        multiply(samples, self.phasors[:len(samples)], out=out)
+        out *= complex64(exp(-2j * pi * self.phase))
+        self.phase = (self.phase + self.cycles_per_sample * len(samples)) % 1.
+
+
+class Channelizer:
+    """
+    Splits one wideband `Source` into several narrowband `ChannelizedSource`
+    streams in a single pass over the data.
+
+    Each channel added with `add_channel` frequency shifts, filters and decimates
+    the parent samples to its own center frequency and sample rate (e.g. one
+    channel per `Signal.f_carrier`). Parent samples are fed through `process`,
+    or pulled from the parent with `update`, in chunks of `chunk_size` samples
+    which every channel consumes in turn while they are in cache. `update`
+    supports `RingBufferSource`, `FileSource` and `MemoryMappedFileSource` parents
+    (and their subclasses).
+    """
+
+    def __init__(self, source, chunk_size=65536):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.channels = []
+        self.index = int(round(source.min_time * source.f_samp))  # next parent sample to process
+        self.scratch = empty((chunk_size,), dtype=complex64)
+
+    def add_channel(self, f_center, decimation, decimation_taps=None, buffer_size=None):
+        """
+        Adds and returns a child stream centered at `f_center` with sample rate
+        `source.f_samp / decimation`. `buffer_size` (in child samples) defaults
+        to the parent buffer length at the child rate.
+        """
+        if buffer_size is None:
+            buffer_size = self.source.buffer_size // decimation
+        if not buffer_size:
+            raise ValueError('`buffer_size` must be given for sources without a buffer')
+        channel = ChannelizedSource(self.source, f_center, decimation, buffer_size, decimation_taps, self.chunk_size)
+        channel.start(self.index)
+        self.channels.append(channel)
+        return channel
+
+    def process(self, samples):
+        """
+        Feeds the next consecutive parent `samples` to every channel.
+        """
+        for i in range(0, len(samples), self.chunk_size):
+            chunk = samples[i:i + self.chunk_size]
+            mixed = self.scratch[:len(chunk)]
+            for channel in self.channels:
+                channel.mix(chunk, mixed)
+                channel.write(channel.decimate(mixed) if channel.decimator is not None else mixed)
+        self.index += len(samples)
+
+    def update(self):
+        """
+        Processes the parent samples that became available since the last call,
+        e.g. after `source.load()` or `source.advance()`.
+        """
+        start = int(round(self.source.min_time * self.source.f_samp))
+        stop = int(round(self.source.max_time * self.source.f_samp))
+        if self.index < start:
+            raise Exception('parent source advanced past samples the channelizer has not processed')
+        if stop <= self.index:
+            return
+        if isinstance(self.source, RingBufferSource):
+            self.process(self.source.get_samples(self.index, stop - self.index))
+        elif isinstance(self.source, FileSource):
+            self.process(self.source.buffer[self.index - start:stop - start])
+        elif isinstance(self.source, MemoryMappedFileSource):
+            # decoded lazily, so fetch a chunk at a time rather than the whole range at once
+            while self.index < stop:
+                count = min(self.chunk_size, stop - self.index)
+                self.process(self.source.get(count, self.index / self.source.f_samp)[0])
+        else:
+            raise TypeError('cannot update from a {0}'.format(type(self.source).__name__))
@@ -0,0 +1,206 @@
+"""
+Chunked, time-indexed container for front-end recordings.
+
+A chunked file stores a recording as fixed-duration chunks, either still packed
+as recorded (`storage='packed'`, decoded with `SampleUnpacker` on read) or
+already decoded (`storage='complex64'`), each optionally compressed. Layout:
+
+    MAGIC | header length (uint32) | JSON header | chunk payloads ... | chunk index | trailer
+
+The JSON header holds the front-end metadata (`f_samp`, `f_center`, `bit_depth`,
+`real`, `iq_order`), the storage and compression settings and the nominal chunk
+length. The chunk index is a `CHUNK_INDEX_DTYPE` array with the byte offset,
+payload size, first sample, sample count and timestamp of every chunk. The
+trailer holds the index offset and chunk count, so opening a file reads only
+the header, trailer and index.
+
+`transcode` converts any `Source` into this format and `ChunkedFileSource`
+reads it back, decoding only the chunks a `get` touches.
+
+Command line usage:
+
+    python -m gnss.receiver.chunked INPUT OUTPUT --f-samp 5e6 --f-center 1.57542e9 --bit-depth 4
+"""
+
+import json
+import zlib
+import bz2
+import lzma
+from struct import Struct
+from collections import OrderedDict
+from numpy import dtype, zeros, frombuffer, memmap, searchsorted, uint8, complex64, ascontiguousarray
+from gnss.receiver.sources import Source, MemoryMappedFileSource, FileSource4BitComplexWithMetaData
+
+MAGIC = b'PYGNSSCK'
+VERSION = 1
+HEADER_LENGTH = Struct('<I')
+TRAILER = Struct('<QQ8s')
+CHUNK_INDEX_DTYPE = dtype([('offset', '<u8'), ('size', '<u8'), ('start_sample', '<i8'), ('num_samples', '<u8'),
+                           ('timestamp', '<f8')])
+COMPRESSORS = {
+    None: (lambda data: data, lambda data: data),
+    'zlib': (zlib.compress, zlib.decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def transcode(source, filepath, chunk_duration=1., storage='packed', compression=None, start_time=0.,
+              duration=None):
+    """
+    Writes the samples of `source` to a chunked file at `filepath` and returns
+    the chunk index.
+
+    inputs
+    ------
+
+    source:
+        the `Source` to read. `storage='packed'` copies the recorded bytes and
+        needs an undecimated source with a `read_packed` method (the file
+        sources); `storage='complex64'` stores decoded samples read with
+        `source.get`, so the source must be able to serve the whole duration
+        (e.g. `MemoryMappedFileSource`, or a channelized stream that is kept fed)
+    chunk_duration:
+        chunk length in seconds
+    compression:
+        None, 'zlib', 'bz2' or 'lzma'
+    start_time:
+        timestamp of the first sample, e.g. in GPS seconds. Chunk timestamps are
+        `start_time + start_sample / f_samp`
+    duration:
+        number of seconds to transcode (default: all of `source`)
+    """
+    if storage not in ('packed', 'complex64'):
+        raise ValueError('`storage` must be one of \'packed\' or \'complex64\'')
+    if compression not in COMPRESSORS:
+        raise ValueError('unsupported compression: {0}'.format(compression))
+    if storage == 'packed' and (source.decimation != 1 or not hasattr(source, 'read_packed')):
+        raise ValueError('packed storage needs an undecimated file source')
+    compress = COMPRESSORS[compression][0]
+    f_samp = source.f_samp
+    chunk_samples = int(round(chunk_duration * f_samp))
+    if storage == 'packed':
+        # keep chunks byte aligned for sub-byte sample formats
+        samples_per_byte = max(1, int(round(1 / source.bytes_per_sample)))
+        chunk_samples -= chunk_samples % samples_per_byte
+        first_sample, num_samples = 0, source.num_source_samples
+    else:
+        first_sample = int(round(source.min_time * f_samp))
+        num_samples = int(round(source.max_time * f_samp)) - first_sample
+    if duration is not None:
+        num_samples = min(num_samples, int(round(duration * f_samp)))
+    header = {
+        'version': VERSION,
+        'f_samp': f_samp,
+        'f_center': source.f_center,
+        'bit_depth': source.bit_depth,
+        'real': source.real,
+        'iq_order': source.unpacker.iq_order,
+        'storage': storage,
+        'compression': compression,
+        'chunk_samples': chunk_samples,
+        'start_time': start_time,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    num_chunks = -(-num_samples // chunk_samples)
+    index = zeros((num_chunks,), dtype=CHUNK_INDEX_DTYPE)
+    with open(filepath, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for i in range(num_chunks):
+            start = first_sample + i * chunk_samples
+            count = min(chunk_samples, first_sample + num_samples - start)
+            if storage == 'packed':
+                payload = ascontiguousarray(source.read_packed(start, count)).tobytes()
+            else:
+                samples, time = source.get(count, start / f_samp)
+                payload = ascontiguousarray(samples, dtype=complex64).tobytes()
+            payload = compress(payload)
+            index[i] = (f.tell(), len(payload), start, count, start_time + start / f_samp)
+            f.write(payload)
+        index_offset = f.tell()
+        f.write(index.tobytes())
+        f.write(TRAILER.pack(index_offset, num_chunks, MAGIC))
+    return index
+
+
+class ChunkedFileSource(MemoryMappedFileSource):
+    """
+    Signal source reading a chunked file written by `transcode`.
+
+    Opening the file reads only its header and chunk index; the chunks are
+    memory-mapped and a chunk is decompressed and decoded the first time `get`
+    needs it. The `num_cached_windows` most recently used chunks are kept.
+    Sample and time arguments are relative to the first stored sample, and
+    `index['timestamp']` gives the recorded timestamp of every chunk.
+    """
+
+    def __init__(self, filepath, num_cached_windows=4):
+        with open(filepath, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('not a chunked recording: {0}'.format(filepath))
+            header_length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+            f.seek(-TRAILER.size, 2)
+            index_offset, num_chunks, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError('chunked recording is truncated: {0}'.format(filepath))
+            f.seek(index_offset)
+            self.index = frombuffer(f.read(num_chunks * CHUNK_INDEX_DTYPE.itemsize), dtype=CHUNK_INDEX_DTYPE)
+        self.filepath = filepath
+        self.storage = self.header['storage']
+        self.decompress = COMPRESSORS[self.header['compression']][1]
+        self.window_size = self.header['chunk_samples']
+        self.num_cached_windows = num_cached_windows
+        self.cache = OrderedDict()
+        Source.__init__(self, self.header['f_samp'], self.header['f_center'], 0, self.header['bit_depth'],
+                        self.header['real'], iq_order=self.header['iq_order'])
+        self.data = memmap(filepath, dtype=uint8, mode='r')
+        self.first_sample = int(self.index['start_sample'][0]) if num_chunks else 0
+        self.num_samples = self.num_source_samples = int(self.index['num_samples'].sum())
+
+    @property
+    def start_time(self):
+        return self.header['start_time']
+
+    def chunk_at(self, time):
+        """
+        Returns the index of the chunk holding the sample at `time`.
+        """
+        n = int(round(time * self.f_samp)) + self.first_sample
+        return int(searchsorted(self.index['start_sample'], n, side='right')) - 1
+
+    def decode_window(self, index):
+        offset, size = int(self.index['offset'][index]), int(self.index['size'][index])
+        payload = self.data[offset:offset + size]
+        if self.header['compression'] is not None:
+            payload = frombuffer(self.decompress(payload), dtype=uint8)
+        if self.storage == 'complex64':
+            return frombuffer(payload, dtype=complex64)
+        return self.unpack(payload)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Transcode a raw front-end recording into a chunked recording.')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--f-samp', type=float, required=True)
+    parser.add_argument('--f-center', type=float, required=True)
+    parser.add_argument('--bit-depth', type=int, default=4)
+    parser.add_argument('--real', action='store_true')
+    parser.add_argument('--iq-order', default='IQ')
+    parser.add_argument('--metadata', action='store_true', help='input has 21-byte headers every 1 ms')
+    parser.add_argument('--chunk-duration', type=float, default=1.)
+    parser.add_argument('--storage', default='packed', choices=['packed', 'complex64'])
+    parser.add_argument('--compression', default=None, choices=[c for c in COMPRESSORS if c])
+    parser.add_argument('--start-time', type=float, default=0.)
+    args = parser.parse_args()
+    if args.metadata:
+        source = FileSource4BitComplexWithMetaData(args.input, args.f_samp, args.f_center, buffer_size=1)
+    else:
+        source = MemoryMappedFileSource(args.input, args.f_samp, args.f_center, args.bit_depth, args.real,
+                                        iq_order=args.iq_order)
+    index = transcode(source, args.output, args.chunk_duration, args.storage, args.compression, args.start_time)
+    print('wrote {0} chunks to {1}'.format(len(index), args.output))
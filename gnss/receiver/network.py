@@ -0,0 +1,229 @@
+"""
+Streaming front-end data over the network.
+
+Packed samples are sent in packets made of a `PACKET_HEADER` (sequence number,
+payload length in bytes) followed by the payload. Each packet carries
+`samples_per_packet` samples. Over UDP a packet is one datagram; over TCP
+packets are sent back to back on the stream.
+
+`NetworkSource` receives packets with asyncio and decodes them into its ring
+buffer. `FileReplaySender` replays a recording as such packets at a
+configurable rate, so the receive path can be tested and benchmarked over
+loopback without hardware.
+"""
+
+import asyncio
+from struct import Struct
+from random import random
+from time import perf_counter
+from numpy import memmap, uint8, zeros
+from gnss.receiver.sources import RingBufferSource
+from gnss.receiver.unpacking import SampleUnpacker
+
+PACKET_HEADER = Struct('<QI')
+
+
+class NetworkSource(RingBufferSource):
+    """
+    Signal source fed by packets of packed samples received over UDP or TCP.
+
+    Received samples are decoded straight into the preallocated ring buffer of
+    `buffer_size` samples, which is addressed by absolute sample index as in
+    `RingBufferSource`; sequence number `k` holds samples
+    `k * samples_per_packet` onward (before decimation).
+
+    Missing sequence numbers are filled with zeros, so sample indices (and
+    times) stay aligned with the sender, and counted in `packets_dropped`.
+    Packets older than the newest one received are counted in `packets_late`
+    and discarded.
+
+    `wait_for_time` waits until the samples up to a given time have arrived.
+    Call `start` within a running event loop to begin receiving and `close` to stop.
+    """
+
+    def __init__(self, f_samp, f_center, buffer_size, bit_depth, real, samples_per_packet, host='127.0.0.1',
+                 port=0, protocol='udp', decimation=1, iq_order='IQ', decimation_taps=None):
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError('`protocol` must be one of \'udp\' or \'tcp\'')
+        super(NetworkSource, self).__init__(f_samp, f_center, buffer_size, bit_depth, real, decimation, iq_order,
+                                            decimation_taps)
+        self.samples_per_packet = samples_per_packet
+        self.bytes_per_packet = int(samples_per_packet * self.bytes_per_sample)
+        if self.bytes_per_packet != samples_per_packet * self.bytes_per_sample:
+            raise ValueError('packets must hold a whole number of bytes')
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.next_sequence = None
+        self.packets_received = 0
+        self.packets_dropped = 0
+        self.packets_late = 0
+        self.waiters = []
+        self.transport = None
+        self.server = None
+        self.zero_packet = zeros((self.bytes_per_packet,), dtype=uint8)
+
+    def handle_packet(self, packet):
+        """
+        Decodes one received packet (header and payload) into the ring buffer.
+        """
+        sequence, length = PACKET_HEADER.unpack_from(packet)
+        payload = memoryview(packet)[PACKET_HEADER.size:PACKET_HEADER.size + length]
+        if length != self.bytes_per_packet:
+            raise ValueError('packet payload of {0} bytes, expected {1}'.format(length, self.bytes_per_packet))
+        if sequence < (self.next_sequence or 0):
+            self.packets_late += 1
+            return
+        missing = sequence - self.next_sequence if self.next_sequence is not None else 0
+        self.packets_dropped += missing
+        if self.next_sequence is None or missing * self.samples_per_packet > self.buffer_size * self.decimation:
+            # first packet, or a gap longer than the ring: restart the stream at this packet
+            self.reset(sequence * self.samples_per_packet // self.decimation)
+            if self.decimator is not None:
+                self.decimator.reset()
+        else:
+            for i in range(missing):
+                self.write_packet(self.zero_packet)
+        self.write_packet(payload)
+        self.packets_received += 1
+        self.next_sequence = sequence + 1
+        self.notify()
+
+    def write_packet(self, payload):
+        if self.decimation > 1:
+            self.write(self.decimate(self.unpack(payload)))
+            return
+        views = self.write_views(self.samples_per_packet)
+        if len(views) == 1:
+            self.unpack(payload, views[0])
+            self.commit(self.samples_per_packet)
+        else:
+            self.write(self.unpack(payload))
+
+    def notify(self):
+        pending = []
+        for index, future in self.waiters:
+            if future.done():
+                continue
+            if index <= self.end_index:
+                future.set_result(self.end_index / self.f_samp)
+            else:
+                pending.append((index, future))
+        self.waiters = pending
+
+    async def wait_for_time(self, time, block_size=0):
+        """
+        Waits until the samples from `time` up to `time + block_size` samples
+        have been received and returns the time up to which data is available.
+        """
+        index = int(round(time * self.f_samp)) + int(block_size)
+        if index <= self.end_index and self.next_sequence is not None:
+            return self.end_index / self.f_samp
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((index, future))
+        return await future
+
+    async def start(self):
+        """
+        Starts listening on (`host`, `port`). If `port` is 0 a free port is
+        chosen and stored in `port`.
+        """
+        loop = asyncio.get_running_loop()
+        if self.protocol == 'udp':
+            source = self
+
+            class Protocol(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    source.handle_packet(data)
+
+            self.transport, protocol = await loop.create_datagram_endpoint(Protocol, local_addr=(self.host, self.port))
+            self.port = self.transport.get_extra_info('sockname')[1]
+        else:
+            self.server = await asyncio.start_server(self.receive_stream, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def receive_stream(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(PACKET_HEADER.size)
+                sequence, length = PACKET_HEADER.unpack(header)
+                self.handle_packet(header + await reader.readexactly(length))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+class FileReplaySender:
+    """
+    Sends a recording of packed samples as `NetworkSource` packets.
+
+    `rate` is the replay speed relative to real time (1 = real time, 2 = twice
+    as fast, None = as fast as possible). `drop_probability` randomly skips
+    packets to exercise dropped-packet handling.
+    """
+
+    def __init__(self, filepath, f_samp, bit_depth, real, samples_per_packet, host='127.0.0.1', port=0,
+                 protocol='udp', rate=1., drop_probability=0.):
+        self.data = memmap(filepath, dtype=uint8, mode='r')
+        self.f_samp = f_samp
+        self.bytes_per_sample = SampleUnpacker(bit_depth, real).bytes_per_sample
+        self.samples_per_packet = samples_per_packet
+        self.bytes_per_packet = int(samples_per_packet * self.bytes_per_sample)
+        self.num_packets = len(self.data) // self.bytes_per_packet
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.rate = rate
+        self.drop_probability = drop_probability
+        self.packets_sent = 0
+
+    def packet(self, sequence):
+        start = sequence * self.bytes_per_packet
+        return PACKET_HEADER.pack(sequence, self.bytes_per_packet) + self.data[start:start + self.bytes_per_packet].tobytes()
+
+    async def run(self, num_packets=None):
+        """
+        Sends `num_packets` packets (default: the whole file) and returns the
+        achieved rate in MSamples/s.
+        """
+        num_packets = self.num_packets if num_packets is None else min(num_packets, self.num_packets)
+        loop = asyncio.get_running_loop()
+        writer = transport = None
+        if self.protocol == 'udp':
+            transport, protocol = await loop.create_datagram_endpoint(asyncio.DatagramProtocol,
+                                                                      remote_addr=(self.host, self.port))
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        packet_period = None if not self.rate else self.samples_per_packet / (self.f_samp * self.rate)
+        start = perf_counter()
+        try:
+            for sequence in range(num_packets):
+                if packet_period is not None:
+                    delay = start + sequence * packet_period - perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if self.drop_probability and random() < self.drop_probability:
+                    continue
+                if transport is not None:
+                    transport.sendto(self.packet(sequence))
+                    await asyncio.sleep(0)  # let a receiver sharing the event loop keep up
+                else:
+                    writer.write(self.packet(sequence))
+                    await writer.drain()
+                self.packets_sent += 1
+        finally:
+            if transport is not None:
+                transport.close()
+            if writer is not None:
+                writer.close()
+                await writer.wait_closed()
+        return num_packets * self.samples_per_packet / (perf_counter() - start) / 1e6
@@ -3,13 +3,19 @@ from collections import OrderedDict
 from numpy import zeros, nan, arange, ceil, sqrt
 
 class TrackingOutputBuffer:
+    """
+    Ring buffers of tracking outputs. Each keyword gives an output's `size` (number
+    of epochs kept) and `dtype`, and optionally the `shape` of one epoch's value,
+    e.g. `(num_taps,)` for the correlations of a `DenseCorrelator`.
+    """
     
     def __init__(self, **outputs):
         self.outputs = outputs
         self.buffers = OrderedDict()
         self.indices = {}
         for key in outputs:
-            self.buffers[key] = zeros((outputs[key]['size'],), dtype=outputs[key]['dtype'])
+            shape = (outputs[key]['size'],) + tuple(outputs[key].get('shape', ()))
+            self.buffers[key] = zeros(shape, dtype=outputs[key]['dtype'])
             self.buffers[key][:] = nan
             self.indices[key] = 0
     
@@ -19,6 +25,17 @@ class TrackingOutputBuffer:
             self.buffers[key][i % self.outputs[key]['size']] = outputs[key]
             self.indices[key] = self.indices[key] + 1
     
+    def extend(self, **outputs):
+        """
+        Pushes the values of several epochs at once, e.g. the `(epoch, tap)` output
+        of `DenseCorrelator.correlate`.
+        """
+        for key in outputs:
+            i = self.indices[key]
+            values = outputs[key]
+            self.buffers[key][(i + arange(len(values))) % self.outputs[key]['size']] = values
+            self.indices[key] = i + len(values)
+    
     def clear(self):
         for key in self.outputs:
             self.buffers[key][:] = 0.
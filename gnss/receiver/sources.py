@@ -1,9 +1,16 @@
 
 # block should return block of data of requested size and the block epoch
 
-from os.path import getsize
+from os.path import getsize, getmtime, isfile
+from glob import glob
 from os import SEEK_SET
-from numpy import zeros, byte, fromfile, uint8, int8, bitwise_and, s_, concatenate, delete
+from collections import OrderedDict
+from threading import Thread, Event
+from queue import Queue, Empty
+from numpy import zeros, fromfile, uint8, int64, arange, dtype, concatenate, cumsum, searchsorted, memmap, \
+    save as save_array, load as load_array
+from gnss.receiver.unpacking import SampleUnpacker
+from gnss.filters.fir_filter import PolyphaseDecimator
 
 
 class Source:
@@ -15,14 +22,27 @@ class Source:
     We can send the Channels sliced views of the buffer. These views do not copy by default.
     
     `decimation` specifies by how much to decimate incoming data. If not 1 (default)
-    takes every nth sample to store in buffer, where n is the value of decimate
+    incoming data passes through a streaming polyphase anti-alias FIR filter
+    (`decimator`) which only computes every nth output sample, where n is the value
+    of `decimation`. `decimation_taps` sets the filter coefficients (a lowpass at
+    the decimated rate is designed by default; `[1.]` gives plain `[::n]` decimation).
+    
+    Raw bytes are decoded by a table-driven `SampleUnpacker` into `complex64` (or
+    `float32` if `real`) samples. `iq_order` ('IQ' or 'QI') gives the order of the
+    components of complex samples. If `integer`, samples are kept as `int8`
+    components instead (`INTEGER_IQ_DTYPE` pairs for complex samples), for the
+    integer and bitwise correlators; these cannot be decimated.
     """
     
     MAX_BUFFER_SIZE = 100000000  # 100 MSamples
     
-    def __init__(self, source_f_samp, source_f_center, buffer_size, bit_depth, real, decimation=1):
+    def __init__(self, source_f_samp, source_f_center, buffer_size, bit_depth, real, decimation=1, iq_order='IQ',
+                 decimation_taps=None, integer=False):
+        if integer and decimation > 1:
+            raise ValueError('integer samples cannot be decimated')
         self.source_f_samp = source_f_samp
         self.decimation = decimation
+        self.decimator = PolyphaseDecimator(decimation, decimation_taps) if decimation > 1 else None
         self.f_samp = source_f_samp / decimation
         self.f_center = source_f_center
         self.bit_depth = bit_depth    # bits per sample component (8 bits total for real+imaginary)
@@ -30,9 +50,9 @@ class Source:
         if buffer_size > Source.MAX_BUFFER_SIZE:
             raise Error('`buffer_size` exceeds `MAX_BUFFER_SIZE`')
         self.buffer_size = buffer_size
-        data_type = float if self.real else complex
-        self.bytes_per_sample = self.bit_depth / 8 if self.real else self.bit_depth / 4
-        self.buffer = zeros((buffer_size,), dtype=data_type)
+        self.unpacker = SampleUnpacker(bit_depth, real, iq_order, integer=integer)
+        self.bytes_per_sample = self.unpacker.bytes_per_sample
+        self.buffer = zeros((buffer_size,), dtype=self.unpacker.dtype)
         self.buffer_start_time = 0.
         
     # abstract???
@@ -58,33 +78,44 @@ class Source:
     
     @property
     def max_time(self):
-        return self.buffer_start_time + self.buffer_size / self.f_samp
+        return self.buffer_start_time + len(self.buffer) / self.f_samp
     
-    def decimate(self, samples):
+    def decimate(self, samples, history=None):
+        '''
+        Filters and decimates `samples` by `decimation` with the polyphase
+        anti-alias filter `decimator`. The filter state carries over from call to
+        call, so consecutive calls must pass consecutive samples. To restart the
+        stream elsewhere, pass the samples preceding `samples` as `history`.
+        '''
+        if history is not None:
+            self.decimator.reset(history)
+        return self.decimator.process(samples)
+
+    def read_history(self, f, file_loc):
+        '''
+        Returns the decoded samples preceding byte `file_loc` of the open file
+        `f` needed to restart the decimation filter there.
+        '''
+        start = max(0, file_loc - int(self.decimator.history_size * self.bytes_per_sample))
+        f.seek(start, SEEK_SET)
+        history = self.unpack(fromfile(f, dtype=uint8, count=file_loc - start))
+        f.seek(file_loc, SEEK_SET)
+        return history
+
+    def unpack(self, byte_arr, out=None):
         '''
-        Performs simple decimation by taking every nth sample, where n
-        is the value of `decimate`
+        Decodes the packed bytes in `byte_arr` into samples, writing them
+        into `out` if given. See `SampleUnpacker.unpack`.
         '''
-        return samples[::self.decimation]
+        return self.unpacker.unpack(byte_arr, out)
     
     def convert_to_complex_samples(self, byte_arr):
         '''
         Generic parsing of complex samples.
-        Handles 4-bit case
-        `samples` is a byte array 
-        TODO add others?
+        `byte_arr` is a byte array 
         Throws error if `self.bit_depth` is unsupported.
         '''
-        # typically real is upper nibble, complex is lower nibble, but TODO make this generic
-        if self.bit_depth == 4:
-            real = (bitwise_and(byte_arr, 0x0f) << 4).astype(int8) >> 4
-            imag = bitwise_and(byte_arr, 0xf0).astype(int8) >> 4
-        elif self.bit_depth == 8:
-            real = byte_arr[0::2]  # TODO this might not be working
-            imag = byte_arr[1::2]
-        else:
-            raise Error('Bit depth not supported for complex samples')
-        return real + 1j * imag
+        return self.unpack(byte_arr)
 
 
 class FileSource(Source):
@@ -94,91 +125,735 @@ class FileSource(Source):
     `file_loc` is the location of the next unread btye from the file, i.e.
     the subsequent sample to the last sample in the current buffer
     
+    Samples are decoded into `storage`, of `buffer_size` samples, and `buffer` is
+    the part of it holding valid data: the last buffer of the file may be
+    shorter than `buffer_size`, and loading past the end of the file raises
+    `EOFError`.
     """
     
-    def __init__(self, filepath, file_f_samp, f_center, bit_depth, real, buffer_size=None, decimation=1):
+    def __init__(self, filepath, file_f_samp, f_center, bit_depth, real, buffer_size=None, decimation=1, iq_order='IQ',
+                 decimation_taps=None, integer=False):
         self.filepath = filepath
         self.file_loc = 0
         self.file_size = getsize(filepath)
+        self.decimator_loc = None  # file location the decimator state corresponds to
         if not buffer_size:
             buffer_size = self.file_size
-        super(FileSource, self).__init__(file_f_samp, f_center, buffer_size, bit_depth, real, decimation)
+        super(FileSource, self).__init__(file_f_samp, f_center, buffer_size, bit_depth, real, decimation, iq_order,
+                                         decimation_taps, integer)
+        self.num_source_samples = int(self.file_size / self.bytes_per_sample)
+        self.storage = self.buffer
 
     def load(self, overlap=0):
         '''
         Loads data from file into Source buffer.
         '''
-        if overlap:
-            self.buffer[:overlap] = self.buffer[-overlap:]
         with open(self.filepath, "rb") as f:  # reopen the file
             f.seek(self.file_loc, SEEK_SET)   # seek
             samples_to_read = self.decimation * (self.buffer_size - overlap)
             bytes_to_read = samples_to_read * self.bytes_per_sample
-            temp = fromfile(f, dtype=byte, count=int(bytes_to_read))
-            if not self.real:
-                temp = self.convert_to_complex_samples(temp)
+            history = None
+            if self.decimation > 1 and self.file_loc != self.decimator_loc:
+                history = self.read_history(f, self.file_loc)
+            temp = fromfile(f, dtype=uint8, count=int(bytes_to_read))
+            if self.unpacker.num_samples(len(temp)) < self.decimation:
+                raise EOFError('no more data in file')
+            if overlap:
+                self.storage[:overlap] = self.buffer[len(self.buffer) - overlap:]
+            self.file_loc += len(temp)
             if self.decimation > 1:
-                temp = self.decimate(temp)
-            self.buffer[overlap:] = temp
+                temp = self.decimate(self.unpack(temp), history)
+                self.decimator_loc = self.file_loc
+                self.storage[overlap:overlap + len(temp)] = temp
+                num_samples = len(temp)
+            else:  # decode straight into the buffer
+                num_samples = self.unpacker.num_samples(len(temp))
+                self.unpack(temp, self.storage[overlap:overlap + num_samples])
+            self.buffer = self.storage[:overlap + num_samples]
+    
+    def read_packed(self, start, count):
+        '''
+        Returns the packed bytes of `count` source samples beginning at source
+        sample `start`.
+        '''
+        with open(self.filepath, "rb") as f:
+            f.seek(int(start * self.bytes_per_sample), SEEK_SET)
+            return fromfile(f, dtype=uint8, count=int(count * self.bytes_per_sample))
             
     def advance(self, overlap=100000):
         '''
-        Advances file offset to next buffer length of data in file, overlapping
-        previous buffer by `overlap` samples.
+        Loads the next buffer length of data in file, overlapping previous
+        buffer by `overlap` samples.
+        
+        Note that the overlap is copied to the front of the buffer; see
+        `RingFileSource` for a source that advances without copying.
         '''
-        # TODO handle overlap and buffer size incompatibilities?
-        self.file_loc += self.buffer_size - overlap  #TODO THIS IS WRONG
-        self.buffer_start_time += (self.buffer_size - overlap) / self.f_samp
+        step = len(self.buffer) - overlap
         self.load(overlap)
+        self.buffer_start_time += step / self.f_samp
 
         
 class FileSource4BitComplexWithMetaData(FileSource):
+    """
+    File source for 4-bit complex recordings framed into 1 ms epochs, each made
+    of a `header_size`-byte metadata header followed by a data segment of
+    `file_f_samp / header_rate` samples.
+    
+    The layout of the file is described by an epoch index (`epoch_index`) that
+    is built on first use and cached next to the recording (`<filepath>.epochs.npy`).
+    It holds the byte offset of every header and data segment along with the
+    header payloads, parsed with `HEADER_DTYPE`. `HEADER_DTYPE` only exposes the
+    raw header bytes; subclasses for a particular header format can override it
+    with a structured dtype of the same size naming the fields (timestamps, etc.).
+    
+    Sample, time and byte offsets convert in constant time, and data segments are
+    decoded directly from a strided view of the memory-mapped file. A trailing
+    incomplete epoch is ignored.
+    
+    `file_loc` is the byte offset of the next unread byte in the file. If it
+    falls inside a header, reading starts at the following data segment.
+    """
+    
+    HEADER_DTYPE = dtype([('payload', uint8, (21,))])
+    INDEX_SUFFIX = '.epochs.npy'
     
-    def __init__(self, filepath, file_f_samp, f_center, buffer_size=None, decimation=1):
+    def __init__(self, filepath, file_f_samp, f_center, buffer_size=None, decimation=1, cache_index=True,
+                 decimation_taps=None):
         
         super(FileSource4BitComplexWithMetaData, self).__init__(filepath, file_f_samp, f_center,
-                                            buffer_size=buffer_size, bit_depth=4, real=False, decimation=decimation)
+                                            buffer_size=buffer_size, bit_depth=4, real=False, decimation=decimation,
+                                            decimation_taps=decimation_taps)
         
-        self.header_size = 21    # bytes
+        self.header_size = self.HEADER_DTYPE.itemsize    # bytes
         self.header_rate = 1000  # Hz
         
-        self.bytes_per_data_segment = self.source_f_samp / self.header_rate * self.bytes_per_sample
+        self.samples_per_data_segment = int(round(self.source_f_samp / self.header_rate))
+        self.bytes_per_data_segment = int(self.samples_per_data_segment * self.bytes_per_sample)
         self.bytes_per_header_epoch = self.header_size + self.bytes_per_data_segment
+        self.num_epochs = self.file_size // self.bytes_per_header_epoch
+        self.num_source_samples = self.num_epochs * self.samples_per_data_segment
         
+        epoch_dtype = dtype([('header', self.HEADER_DTYPE), ('data', uint8, (self.bytes_per_data_segment,))])
+        self.epochs = memmap(filepath, dtype=epoch_dtype, mode='r', shape=(self.num_epochs,))
+        self.cache_index = cache_index
+        self._epoch_index = None
+    
+    @property
+    def index_dtype(self):
+        return dtype([('header_offset', int64), ('data_offset', int64), ('header', self.HEADER_DTYPE)])
+    
+    @property
+    def epoch_index(self):
+        """
+        Structured array with the `header_offset`, `data_offset` and `header`
+        payload of every epoch in the file.
+        """
+        if self._epoch_index is None:
+            self._epoch_index = self.build_epoch_index()
+        return self._epoch_index
+    
+    @property
+    def headers(self):
+        return self.epoch_index['header']
+    
+    def build_epoch_index(self):
+        """
+        Loads the cached epoch index if it is present and up to date, otherwise
+        builds it from the file (and caches it if `cache_index` is set).
+        """
+        index_path = self.filepath + self.INDEX_SUFFIX
+        if self.cache_index and isfile(index_path) and getmtime(index_path) >= getmtime(self.filepath):
+            index = load_array(index_path)
+            if index.dtype == self.index_dtype and len(index) == self.num_epochs:
+                return index
+        index = zeros((self.num_epochs,), dtype=self.index_dtype)
+        index['header_offset'] = arange(self.num_epochs, dtype=int64) * self.bytes_per_header_epoch
+        index['data_offset'] = index['header_offset'] + self.header_size
+        index['header'] = self.epochs['header']
+        if self.cache_index:
+            try:
+                save_array(index_path, index)
+            except OSError:  # e.g. read-only archive, just keep the index in memory
+                pass
+        return index
+    
+    def sample_to_byte(self, n):
+        """
+        Returns the file byte offset of source (undecimated) sample `n`.
+        """
+        epoch, offset = divmod(n, self.samples_per_data_segment)
+        return epoch * self.bytes_per_header_epoch + self.header_size + int(offset * self.bytes_per_sample)
+    
+    def byte_to_sample(self, loc):
+        """
+        Returns the index of the first source sample at or after file byte offset `loc`.
+        """
+        epoch, offset = divmod(loc, self.bytes_per_header_epoch)
+        offset = max(0, offset - self.header_size)
+        return epoch * self.samples_per_data_segment + int(offset / self.bytes_per_sample)
+    
+    def time_to_byte(self, time):
+        return self.sample_to_byte(int(round(time * self.source_f_samp)))
+    
+    def seek(self, time):
+        """
+        Positions the source so that the next `load` starts at `time`.
+        """
+        n = int(round(time * self.f_samp))
+        self.file_loc = self.sample_to_byte(n * self.decimation)
+        self.buffer_start_time = n / self.f_samp
+    
+    def read_packed(self, start, count):
+        """
+        Returns the packed bytes of `count` source samples beginning at source
+        sample `start`, with headers removed.
+        """
+        stop = min(start + count, self.num_source_samples)
+        data = self.epochs['data']
+        first_epoch, first_offset = divmod(start, self.samples_per_data_segment)
+        last_epoch, last_offset = divmod(stop, self.samples_per_data_segment)
+        b0, b1 = int(first_offset * self.bytes_per_sample), int(last_offset * self.bytes_per_sample)
+        if first_epoch == last_epoch:
+            return data[first_epoch, b0:b1]
+        return concatenate((data[first_epoch, b0:], data[first_epoch + 1:last_epoch].reshape((-1,)),
+                            data[last_epoch, :b1] if last_epoch < self.num_epochs else data[:0, 0]))
+    
+    def read_samples(self, start, count, out=None):
+        """
+        Decodes up to `count` source samples beginning at source sample `start`,
+        skipping headers, into `out` (allocated if None) and returns `out`.
+        """
+        stop = min(start + count, self.num_source_samples)
+        if out is None:
+            out = zeros((max(0, stop - start),), dtype=self.unpacker.dtype)
+        if stop <= start:
+            return out
+        data = self.epochs['data']
+        first_epoch, first_offset = divmod(start, self.samples_per_data_segment)
+        last_epoch, last_offset = divmod(stop, self.samples_per_data_segment)
+        b0, b1 = int(first_offset * self.bytes_per_sample), int(last_offset * self.bytes_per_sample)
+        if first_epoch == last_epoch:
+            return self.unpack(data[first_epoch, b0:b1], out)
+        n = self.samples_per_data_segment - first_offset
+        self.unpack(data[first_epoch, b0:], out[:n])
+        m = (last_epoch - first_epoch - 1) * self.samples_per_data_segment
+        if m:
+            self.unpack(data[first_epoch + 1:last_epoch], out[n:n + m])
+        if b1:
+            self.unpack(data[last_epoch, :b1], out[n + m:])
+        return out
+    
     def load(self, overlap=0):
         '''
         Loads data from file into Source buffer.
-        
-        NOTE: simplification made under assumption that file_loc is never
-        left in the middle of a header.
         '''
+        start = self.byte_to_sample(self.file_loc)
+        count = min(self.decimation * (self.buffer_size - overlap), self.num_source_samples - start)
+        if count < self.decimation:
+            raise EOFError('no more data in file')
         if overlap:
-            self.buffer[:overlap] = self.buffer[-overlap:]
-        with open(self.filepath, "rb") as f:  # reopen the file
-            f.seek(self.file_loc, SEEK_SET)   # seek
+            self.storage[:overlap] = self.buffer[len(self.buffer) - overlap:]
+        if self.decimation > 1:
+            history = None
+            if start != self.decimator_loc:
+                history = self.read_samples(max(0, start - self.decimator.history_size), min(start, self.decimator.history_size))
+            temp = self.decimate(self.read_samples(start, count), history)
+            self.decimator_loc = start + count  # in source samples
+            self.storage[overlap:overlap + len(temp)] = temp
+            num_samples = len(temp)
+        else:  # decode straight into the buffer
+            self.read_samples(start, count, self.storage[overlap:overlap + count])
+            num_samples = count
+        self.buffer = self.storage[:overlap + num_samples]
+        self.file_loc = self.sample_to_byte(start + count)
+    
+    def advance(self, overlap=100000):
+        '''
+        Loads the data following the current buffer, overlapping the previous
+        buffer by `overlap` samples.
+        '''
+        step = len(self.buffer) - overlap
+        self.load(overlap)
+        self.buffer_start_time += step / self.f_samp
 
-            samples_to_read = self.decimation * (self.buffer_size - overlap)
-            bytes_to_read = samples_to_read * self.bytes_per_sample
-            
-            first_epoch_index = self.file_loc % self.bytes_per_header_epoch
-            bytes_to_read_counter = bytes_to_read
-            bytes_to_read_counter -= first_epoch_index  # account for front bytes
-            while bytes_to_read_counter >= self.bytes_per_data_segment:  # for each header epoch read, account for header size in bytes read
-                bytes_to_read_counter -= self.bytes_per_data_segment
-                bytes_to_read += self.header_size
-            
-            temp = fromfile(f, dtype=byte, count=int(bytes_to_read))
-            
-            num_full_epochs = (bytes_to_read - first_epoch_index) // self.bytes_per_header_epoch
-            last_epoch_index = first_epoch_index + num_full_epochs * self.bytes_per_header_epoch
-            first_sample_index = max(0, first_epoch_index - self.bytes_per_data_segment)
-            temp = concatenate(
-                (temp[first_sample_index:first_epoch_index],
-                 delete(temp[first_epoch_index:last_epoch_index].reshape((num_full_epochs, self.bytes_per_header_epoch)), s_[:self.header_size], 1).flatten(),
-                 temp[last_epoch_index + self.header_size:]))
-            
-            if not self.real:
-                temp = self.convert_to_complex_samples(temp)
+        
+class MemoryMappedFileSource(Source):
+    """
+    Signal source that memory-maps a recording and decodes samples lazily.
+    
+    The packed bytes stay on disk (`numpy.memmap`); only the sample ranges
+    requested through `get` are decoded. Decoding is done in fixed windows of
+    `window_size` (decimated) samples, and the `num_cached_windows` most recently
+    used windows are kept so that the overlapping reads made by acquisition and
+    tracking do not decode the same data twice. Resident memory is therefore
+    bounded by roughly `num_cached_windows * window_size` samples regardless of
+    recording length.
+    
+    `get` returns a view into the cache when the requested block lies inside a
+    single window, and a single concatenated copy otherwise.
+    """
+    
+    def __init__(self, filepath, file_f_samp, f_center, bit_depth, real, window_size=1000000,
+                 num_cached_windows=8, decimation=1, iq_order='IQ', decimation_taps=None, integer=False):
+        self.filepath = filepath
+        self.file_size = getsize(filepath)
+        self.window_size = window_size
+        self.num_cached_windows = num_cached_windows
+        self.cache = OrderedDict()
+        # no contiguous buffer is kept, decoded windows live in `self.cache`
+        super(MemoryMappedFileSource, self).__init__(file_f_samp, f_center, 0, bit_depth, real, decimation, iq_order,
+                                                     decimation_taps, integer)
+        self.data = memmap(filepath, dtype=uint8, mode='r')
+        self.num_source_samples = int(self.file_size / self.bytes_per_sample)
+        self.num_samples = -(-self.num_source_samples // self.decimation)
+    
+    @property
+    def min_time(self):
+        return 0.
+    
+    @property
+    def max_time(self):
+        return self.num_samples / self.f_samp
+    
+    def decode(self, start, stop):
+        """
+        Decodes (and decimates) the samples in range [`start`, `stop`) of the
+        source, given in source (undecimated) sample indices.
+        """
+        temp = self.unpack(self.read_packed(start, stop - start))
+        if self.decimation > 1:  # windows are decoded in any order, so always restart the filter
+            history_start = max(0, start - self.decimator.history_size)
+            history = self.unpack(self.read_packed(history_start, start - history_start))
+            temp = self.decimate(temp, history)
+        return temp
+    
+    def read_packed(self, start, count):
+        """
+        Returns the packed bytes of `count` source samples beginning at source
+        sample `start`.
+        """
+        return self.data[int(start * self.bytes_per_sample):int((start + count) * self.bytes_per_sample)]
+    
+    def decode_window(self, index):
+        start = index * self.window_size * self.decimation
+        stop = min(start + self.window_size * self.decimation, self.num_source_samples)
+        return self.decode(start, stop)
+    
+    def window(self, index):
+        """
+        Returns the decoded samples of window `index`, decoding them if they
+        are not already cached.
+        """
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        samples = self.decode_window(index)
+        self.cache[index] = samples
+        while len(self.cache) > self.num_cached_windows:
+            self.cache.popitem(last=False)
+        return samples
+    
+    def get(self, block_size, time=None):
+        """
+        If `time` is None, returns block at the beginning of the recording
+        """
+        if time:
+            n = round(time * self.f_samp)
+            if n < 0 or self.num_samples <= n:
+                raise Exception('time outside of source range')
+        else:
+            n = 0
+        if self.num_samples < n + block_size:
+            raise Exception('requested sample range extends beyond source sample range')
+        time = n / self.f_samp
+        first, last = n // self.window_size, (n + block_size - 1) // self.window_size
+        offset = n - first * self.window_size
+        if first == last:
+            return self.window(first)[offset:offset + block_size], time
+        block = concatenate([self.window(i) for i in range(first, last + 1)])
+        return block[offset:offset + block_size], time
+    
+    def clear_cache(self):
+        self.cache.clear()
+
+
+class PrefetchingFileSource(FileSource):
+    """
+    File source that reads and decodes upcoming buffers on a background thread.
+    
+    While the consumer works on the current buffer, a worker thread fills up to
+    `prefetch_depth` further buffers, each starting `buffer_size - overlap`
+    samples after the previous one, so `advance` only swaps buffers instead of
+    waiting on disk I/O and decoding. The file is opened once by the worker.
+    
+    Because buffers are prepared ahead of time, `overlap` is fixed at
+    construction. `get`, `min_time` and `max_time` behave as for `FileSource`;
+    the last buffer of the file may be shorter than `buffer_size`. Call `close`
+    to stop the worker.
+    """
+    
+    def __init__(self, filepath, file_f_samp, f_center, bit_depth, real, buffer_size=None, decimation=1,
+                 iq_order='IQ', overlap=100000, prefetch_depth=2, decimation_taps=None, integer=False):
+        super(PrefetchingFileSource, self).__init__(filepath, file_f_samp, f_center, bit_depth, real,
+                                                    buffer_size, decimation, iq_order, decimation_taps, integer)
+        if not 0 <= overlap < self.buffer_size:
+            raise ValueError('`overlap` must be non-negative and smaller than `buffer_size`')
+        if prefetch_depth < 1:
+            raise ValueError('`prefetch_depth` must be at least 1')
+        self.overlap = overlap
+        self.prefetch_depth = prefetch_depth
+        self.worker = None
+        self.stop_event = Event()
+        self.ready = None
+        self.free = None
+        self.current = None
+    
+    @property
+    def max_time(self):
+        return self.buffer_start_time + len(self.buffer) / self.f_samp
+    
+    def start_sample(self):
+        # first (decimated) sample of the buffer starting at `self.file_loc`
+        return int(round(self.file_loc / self.bytes_per_sample)) // self.decimation
+    
+    def prefetch(self, start_sample):
+        """
+        Worker loop: fills free buffers with consecutive buffer lengths of data
+        beginning at `start_sample` and hands them to the consumer.
+        """
+        step = self.buffer_size - self.overlap
+        try:
+            with open(self.filepath, "rb") as f:
+                while not self.stop_event.is_set():
+                    buffer = self.free.get()
+                    if buffer is None:
+                        return
+                    file_loc = int(start_sample * self.decimation * self.bytes_per_sample)
+                    # buffers overlap, so the decimation filter restarts for each one
+                    history = self.read_history(f, file_loc) if self.decimation > 1 else None
+                    f.seek(file_loc, SEEK_SET)
+                    temp = fromfile(f, dtype=uint8, count=int(self.decimation * self.buffer_size * self.bytes_per_sample))
+                    if self.decimation > 1:
+                        temp = self.decimate(self.unpack(temp), history)
+                        buffer[:len(temp)] = temp
+                        num_samples = len(temp)
+                    else:
+                        num_samples = self.unpacker.num_samples(len(temp))
+                        self.unpack(temp, buffer[:num_samples])
+                    if num_samples == 0:
+                        self.ready.put(None)
+                        return
+                    self.ready.put((start_sample, buffer, num_samples))
+                    if num_samples < self.buffer_size:
+                        self.ready.put(None)
+                        return
+                    start_sample += step
+        except Exception as e:
+            self.ready.put(e)
+    
+    def close(self):
+        """
+        Stops the prefetching worker, if running.
+        """
+        if self.worker is not None:
+            self.stop_event.set()
+            self.free.put(None)
+            while self.worker.is_alive():  # unblock a worker waiting on a full queue
+                try:
+                    self.ready.get_nowait()
+                except Empty:
+                    pass
+                self.worker.join(.01)
+            self.worker = None
+    
+    def load(self, overlap=0):
+        """
+        (Re)starts prefetching at `file_loc` and loads the first buffer.
+        """
+        self.close()
+        self.stop_event.clear()
+        self.ready = Queue(maxsize=self.prefetch_depth)
+        self.free = Queue()
+        for i in range(self.prefetch_depth + 1):
+            self.free.put(zeros((self.buffer_size,), dtype=self.unpacker.dtype))
+        self.current = None
+        self.worker = Thread(target=self.prefetch, args=(self.start_sample(),), daemon=True)
+        self.worker.start()
+        self.swap()
+    
+    def swap(self):
+        item = self.ready.get()
+        if isinstance(item, Exception):
+            raise item
+        if item is None:
+            raise EOFError('no more data in file')
+        start_sample, buffer, num_samples = item
+        if self.current is not None:
+            self.free.put(self.current)
+        self.current = buffer
+        self.buffer = buffer[:num_samples]
+        self.buffer_start_time = start_sample / self.f_samp
+        self.file_loc = int(start_sample * self.decimation * self.bytes_per_sample)
+    
+    def advance(self, overlap=None):
+        """
+        Swaps in the next prefetched buffer, which overlaps the previous buffer
+        by the `overlap` samples given at construction.
+        """
+        if overlap is not None and overlap != self.overlap:
+            raise ValueError('`overlap` is fixed at construction for PrefetchingFileSource')
+        self.swap()
+
+
+class RingBufferSource(Source):
+    """
+    Source whose buffer is a ring of `buffer_size` samples addressed by absolute
+    (64-bit integer) sample indices since the start of the stream.
+    
+    New samples are appended with `write` (or decoded in place through
+    `write_views`/`commit`), overwriting the oldest samples once the ring is
+    full, so advancing never moves data already in the buffer. Samples
+    `start_index` up to (but excluding) `end_index` are available.
+    
+    `get_samples` returns a view of the ring when the requested range is
+    contiguous in memory and a single gathered copy when it wraps. Views remain
+    valid only until the samples they refer to are overwritten.
+    
+    Positions are integer sample counts, so `time = index / f_samp` stays exact
+    no matter how long the source runs.
+    """
+    
+    def __init__(self, source_f_samp, source_f_center, buffer_size, bit_depth, real, decimation=1, iq_order='IQ',
+                 decimation_taps=None, integer=False):
+        super(RingBufferSource, self).__init__(source_f_samp, source_f_center, int(buffer_size), bit_depth, real,
+                                               decimation, iq_order, decimation_taps, integer)
+        self.start_index = 0  # oldest sample in buffer
+        self.end_index = 0    # one past newest sample in buffer
+    
+    @property
+    def buffer_start_time(self):
+        return self.start_index / self.f_samp
+    
+    @buffer_start_time.setter
+    def buffer_start_time(self, value):
+        # `Source.__init__` sets the start time; positions are tracked by `start_index`
+        pass
+    
+    @property
+    def min_time(self):
+        return self.start_index / self.f_samp
+    
+    @property
+    def max_time(self):
+        return self.end_index / self.f_samp
+    
+    @property
+    def num_available(self):
+        return self.end_index - self.start_index
+    
+    def reset(self, index=0):
+        """
+        Empties the ring and sets the index of the next written sample.
+        """
+        self.start_index = self.end_index = int(index)
+    
+    def write_views(self, count):
+        """
+        Returns the one or two slices of the ring into which the next `count`
+        samples should be written, in order. Call `commit` once they are filled.
+        """
+        if count > self.buffer_size:
+            raise ValueError('cannot write more than `buffer_size` samples at once')
+        i = self.end_index % self.buffer_size
+        if i + count <= self.buffer_size:
+            return (self.buffer[i:i + count],)
+        return (self.buffer[i:], self.buffer[:count - (self.buffer_size - i)])
+    
+    def commit(self, count):
+        """
+        Marks the next `count` samples (written through `write_views`) as valid.
+        """
+        self.end_index += count
+        self.start_index = max(self.start_index, self.end_index - self.buffer_size)
+    
+    def write(self, samples):
+        """
+        Appends `samples` to the ring.
+        """
+        if len(samples) > self.buffer_size:
+            self.end_index += len(samples) - self.buffer_size
+            samples = samples[-self.buffer_size:]
+        n = 0
+        for view in self.write_views(len(samples)):
+            view[:] = samples[n:n + len(view)]
+            n += len(view)
+        self.commit(len(samples))
+    
+    def get_samples(self, start_index, count):
+        """
+        Returns `count` samples starting at absolute sample index `start_index`.
+        """
+        if start_index < self.start_index or self.end_index < start_index + count:
+            raise Exception('requested sample range [{0}, {1}) outside of buffer range [{2}, {3})'.format(
+                    start_index, start_index + count, self.start_index, self.end_index))
+        i = start_index % self.buffer_size
+        if i + count <= self.buffer_size:
+            return self.buffer[i:i + count]
+        return concatenate((self.buffer[i:], self.buffer[:count - (self.buffer_size - i)]))
+    
+    def get(self, block_size, time=None):
+        """
+        If `time` is None, returns the oldest block in the buffer
+        """
+        n = self.start_index if time is None else int(round(time * self.f_samp))
+        return self.get_samples(n, int(block_size)), n / self.f_samp
+
+
+class RingFileSource(RingBufferSource):
+    """
+    File source backed by a `RingBufferSource`.
+    
+    `load` fills the ring from the current file position; `advance` decodes
+    the next `buffer_size - overlap` samples over the oldest samples of the
+    ring instead of copying the overlap to the front of the buffer. The file
+    position is kept as an integer sample index.
+    """
+    
+    def __init__(self, filepath, file_f_samp, f_center, bit_depth, real, buffer_size, decimation=1, iq_order='IQ',
+                 decimation_taps=None, integer=False):
+        self.filepath = filepath
+        self.file_size = getsize(filepath)
+        self.file = None
+        self.decimator_loc = None
+        super(RingFileSource, self).__init__(file_f_samp, f_center, buffer_size, bit_depth, real, decimation, iq_order,
+                                             decimation_taps, integer)
+        self.num_source_samples = int(self.file_size / self.bytes_per_sample)
+    
+    @property
+    def file_loc(self):
+        # byte offset of the next unread byte
+        return int(self.end_index * self.decimation * self.bytes_per_sample)
+    
+    def read(self, count):
+        """
+        Reads and appends up to `count` (decimated) samples to the ring, returning
+        the number of samples appended.
+        """
+        if self.file is None:
+            self.file = open(self.filepath, "rb")
+        first = self.end_index * self.decimation
+        count = min(count, (self.num_source_samples - first) // self.decimation)
+        if count <= 0:
+            return 0
+        file_loc = int(first * self.bytes_per_sample)
+        history = None
+        if self.decimation > 1 and file_loc != self.decimator_loc:
+            history = self.read_history(self.file, file_loc)
+        self.file.seek(file_loc, SEEK_SET)
+        temp = fromfile(self.file, dtype=uint8, count=int(count * self.decimation * self.bytes_per_sample))
+        views = self.write_views(count)
+        if self.decimation == 1 and len(views) == 1:  # decode straight into the ring
+            self.unpack(temp, views[0])
+            self.commit(count)
+        else:
+            temp = self.unpack(temp)
             if self.decimation > 1:
-                temp = self.decimate(temp)
-            self.buffer[overlap:] = temp
\ No newline at end of file
+                temp = self.decimate(temp, history)
+            self.write(temp[:count])
+            self.decimator_loc = self.file_loc
+        return count
+    
+    def load(self, index=0):
+        """
+        Fills the ring with samples starting at sample index `index`.
+        """
+        self.reset(index)
+        self.read(self.buffer_size)
+    
+    def advance(self, overlap=100000):
+        """
+        Reads the next `buffer_size - overlap` samples into the ring, keeping the
+        newest `overlap` samples of the previous buffer.
+        """
+        self.read(self.buffer_size - overlap)
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class MultiFileSource(MemoryMappedFileSource):
+    """
+    Signal source presenting an ordered set of recording files (e.g. a
+    front-end's rolled-over capture files) as one continuous stream.
+    
+    `filepaths` is a list of files in stream order or a glob pattern, whose
+    matches are sorted by name. A sample index of the files (`file_starts`) is
+    computed from their sizes up front; `get` then works across the whole
+    session as for `MemoryMappedFileSource`, with blocks crossing file
+    boundaries stitched together transparently. Files are memory-mapped on
+    first use and the `max_open_files` most recently used maps are kept open.
+    """
+    
+    def __init__(self, filepaths, file_f_samp, f_center, bit_depth, real, window_size=1000000,
+                 num_cached_windows=8, decimation=1, iq_order='IQ', decimation_taps=None, max_open_files=4,
+                 integer=False):
+        if isinstance(filepaths, str):
+            filepaths = sorted(glob(filepaths))
+        if not filepaths:
+            raise ValueError('no files given')
+        self.filepaths = list(filepaths)
+        self.window_size = window_size
+        self.num_cached_windows = num_cached_windows
+        self.cache = OrderedDict()
+        self.max_open_files = max_open_files
+        self.open_files = OrderedDict()
+        Source.__init__(self, file_f_samp, f_center, 0, bit_depth, real, decimation, iq_order, decimation_taps, integer)
+        self.file_sizes = [getsize(filepath) for filepath in self.filepaths]
+        file_samples = [int(size / self.bytes_per_sample) for size in self.file_sizes]
+        self.file_starts = concatenate(([0], cumsum(file_samples))).astype(int64)
+        self.file_size = sum(self.file_sizes)
+        self.num_source_samples = int(self.file_starts[-1])
+        self.num_samples = -(-self.num_source_samples // self.decimation)
+    
+    def file_data(self, i):
+        """
+        Returns the memory map of file `i`, opening it if it is not in the pool.
+        """
+        if i in self.open_files:
+            self.open_files.move_to_end(i)
+            return self.open_files[i]
+        data = memmap(self.filepaths[i], dtype=uint8, mode='r')
+        self.open_files[i] = data
+        while len(self.open_files) > self.max_open_files:
+            self.open_files.popitem(last=False)
+        return data
+    
+    def file_at(self, time):
+        """
+        Returns the path of the file holding the sample at `time` and the
+        offset in seconds of that sample within the file.
+        """
+        n = int(round(time * self.f_samp)) * self.decimation
+        i = int(searchsorted(self.file_starts, n, side='right')) - 1
+        return self.filepaths[i], float(n - self.file_starts[i]) / self.source_f_samp
+    
+    def read_packed(self, start, count):
+        stop = min(start + count, self.num_source_samples)
+        pieces = []
+        i = int(searchsorted(self.file_starts, start, side='right')) - 1
+        while start < stop:
+            file_stop = min(stop, self.file_starts[i + 1])
+            offset = start - self.file_starts[i]
+            data = self.file_data(i)
+            pieces.append(data[int(offset * self.bytes_per_sample):int((file_stop - self.file_starts[i]) * self.bytes_per_sample)])
+            start = file_stop
+            i += 1
+        if len(pieces) == 1:
+            return pieces[0]
+        return concatenate(pieces) if pieces else zeros((0,), dtype=uint8)
+    
+    def clear_cache(self):
+        self.cache.clear()
+        self.open_files.clear()
@@ -0,0 +1,152 @@
+"""
+Table-driven unpacking of packed front-end samples.
+
+Every byte value is decoded once into a lookup table of sample components, so
+unpacking a recording is a single fancy-index pass (`numpy.take`) from the raw
+bytes straight into a preallocated `complex64` (or `float32` for real data)
+output buffer.
+
+Supported formats are 2, 4 and 8-bit two's complement components (table driven)
+and 16-bit little-endian components (direct conversion). Complex samples are
+stored as consecutive (I, Q) components; `iq_order='QI'` swaps them. For
+sub-byte formats, `lsb_first` says whether the first component of a byte sits
+in its least significant bits.
+
+Table-driven formats can also be unpacked to integers (`integer=True`): `int8`
+components, as pairs of `INTEGER_IQ_DTYPE` for complex samples, which the integer
+and bitwise correlators of `gnss.tracking.quantized` use as they are.
+"""
+
+from time import perf_counter
+from numpy import arange, asarray, around, dtype, empty, float32, complex64, int8, uint8, take, copyto, random
+
+SUPPORTED_BIT_DEPTHS = (2, 4, 8, 16)
+
+# complex samples as a pair of `int8` components
+INTEGER_IQ_DTYPE = dtype([('i', int8), ('q', int8)])
+
+
+def component_table(bit_depth, lsb_first=True, levels=None):
+    """
+    Returns a (256, 8 // `bit_depth`) `float32` table holding the component
+    values packed in each possible byte value, in stream order.
+
+    `levels`, if given, maps each `bit_depth`-bit code to its value (e.g.
+    `[1, 3, -1, -3]` for sign/magnitude 2-bit data); otherwise codes are
+    interpreted as two's complement integers.
+    """
+    if bit_depth not in (2, 4, 8):
+        raise ValueError('lookup tables only exist for 2, 4 and 8-bit components')
+    per_byte = 8 // bit_depth
+    mask = (1 << bit_depth) - 1
+    byte_values = arange(256)
+    table = empty((256, per_byte), dtype=float32)
+    for j in range(per_byte):
+        shift = j * bit_depth if lsb_first else (per_byte - 1 - j) * bit_depth
+        codes = (byte_values >> shift) & mask
+        if levels is not None:
+            table[:, j] = asarray(levels, dtype=float32)[codes]
+        else:
+            table[:, j] = codes - ((codes >> (bit_depth - 1)) << bit_depth)  # sign extend
+    return table
+
+
+class SampleUnpacker:
+    """
+    Decodes packed bytes into `complex64` (or `float32` if `real`) samples, or if
+    `integer` into `INTEGER_IQ_DTYPE` (or `int8`) samples.
+
+    `bit_depth` is the number of bits per sample component, as in `Source`.
+    """
+
+    def __init__(self, bit_depth, real, iq_order='IQ', lsb_first=True, levels=None, integer=False):
+        if bit_depth not in SUPPORTED_BIT_DEPTHS:
+            raise ValueError('Bit depth not supported: {0}'.format(bit_depth))
+        if integer and bit_depth == 16:
+            raise ValueError('16-bit components do not fit `int8`')
+        if iq_order not in ('IQ', 'QI'):
+            raise ValueError('`iq_order` must be one of \'IQ\' or \'QI\'')
+        self.bit_depth = bit_depth
+        self.real = real
+        self.iq_order = iq_order
+        self.integer = integer
+        self.components_per_sample = 1 if real else 2
+        self.bytes_per_sample = bit_depth * self.components_per_sample / 8
+        if integer:
+            self.dtype = int8 if real else INTEGER_IQ_DTYPE
+        else:
+            self.dtype = float32 if real else complex64
+        self.table = None
+        if bit_depth < 16:
+            self.table = component_table(bit_depth, lsb_first, levels)
+            if integer:
+                if (self.table != around(self.table)).any() or self.table.min() < -128 or self.table.max() > 127:
+                    raise ValueError('`levels` must be integers that fit `int8`')
+                self.table = self.table.astype(int8)
+            if not real and iq_order == 'QI' and self.table.shape[1] > 1:
+                # swap each (Q, I) pair of columns so components come out as (I, Q)
+                self.table = self.table.reshape((256, -1, 2))[:, :, ::-1].reshape((256, -1)).copy()
+
+    def num_samples(self, num_bytes):
+        return int(num_bytes // self.bytes_per_sample)
+
+    def unpack(self, byte_arr, out=None):
+        """
+        Unpacks `byte_arr` into `out` (allocated if None) and returns `out`.
+        Trailing bytes that do not make up a whole sample are ignored.
+        
+        `byte_arr` may also be a 2-D (possibly strided) array of byte rows, e.g.
+        the data segments of a framed recording, in which case each row must
+        hold a whole number of samples and the rows are decoded in order
+        without first being copied into a contiguous array.
+        """
+        byte_arr = asarray(byte_arr).view(uint8)
+        if byte_arr.ndim == 1:
+            num_bytes = int(self.num_samples(len(byte_arr)) * self.bytes_per_sample)
+            byte_arr = byte_arr[:num_bytes].reshape((1, num_bytes))
+        elif self.num_samples(byte_arr.shape[1]) * self.bytes_per_sample != byte_arr.shape[1]:
+            raise ValueError('rows of `byte_arr` must hold a whole number of samples')
+        num_samples = self.num_samples(byte_arr.size)
+        if out is None:
+            out = empty((num_samples,), dtype=self.dtype)
+        elif len(out) != num_samples:
+            raise ValueError('`out` has length {0} but data holds {1} samples'.format(len(out), num_samples))
+        components = out if self.real else out.view(int8 if self.integer else float32)
+        rows = byte_arr.shape[0]
+        if self.bit_depth == 16:
+            values = byte_arr.view('<i2')
+            if not self.real and self.iq_order == 'QI':
+                values = values.reshape((rows, -1, 2))[:, :, ::-1]
+            copyto(components.reshape(values.shape), values)
+            return out
+        indices = byte_arr
+        per_byte = self.table.shape[1]
+        if not self.real and per_byte == 1 and self.iq_order == 'QI':
+            indices = indices.reshape((rows, -1, 2))[:, :, ::-1]
+        take(self.table, indices, axis=0, out=components.reshape(indices.shape + (per_byte,)), mode='clip')
+        return out
+
+
+def benchmark_unpacking(num_bytes=2**24, repeat=5):
+    """
+    Measures unpacking throughput for each supported format and returns a
+    dict mapping (bit_depth, real) to decoded MSamples/s.
+    """
+    byte_arr = random.randint(0, 256, size=num_bytes).astype(uint8)
+    results = {}
+    for bit_depth in SUPPORTED_BIT_DEPTHS:
+        for real in (False, True):
+            unpacker = SampleUnpacker(bit_depth, real)
+            out = empty((unpacker.num_samples(num_bytes),), dtype=unpacker.dtype)
+            best = float('inf')
+            for i in range(repeat):
+                start = perf_counter()
+                unpacker.unpack(byte_arr, out)
+                best = min(best, perf_counter() - start)
+            results[(bit_depth, real)] = len(out) / best / 1e6
+    return results
+
+
+if __name__ == "__main__":
+    for (bit_depth, real), rate in benchmark_unpacking().items():
+        print('{0:2d}-bit {1:7s} {2:10.1f} MSamples/s'.format(bit_depth, 'real' if real else 'complex', rate))
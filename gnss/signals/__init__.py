@@ -1,2 +1,4 @@
 # init for signals
 from gnss.signals.signals import Signal, GPSL1_CARRIER_FREQUENCY, GPSL2_CARRIER_FREQUENCY, GPSL5_CARRIER_FREQUENCY
+from gnss.signals.replicas import ReplicaCache, replica_cache, sample_code
+from gnss.signals.nco import CarrierNCO, CodeNCO, carrier_replicas, phase_quantization_loss
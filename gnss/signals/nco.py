@@ -0,0 +1,197 @@
+"""
+Numerically controlled oscillators (NCOs) for carrier and code replicas.
+
+`CarrierNCO` keeps the carrier phase in a 32-bit fixed-point accumulator
+(`2**32` words per cycle) and looks the replica up in a table of `2**table_bits`
+sine/cosine values, instead of evaluating `exp` per sample. `CodeNCO` keeps the
+code phase in a 64-bit accumulator with `CODE_FRACTION_BITS` fractional chip bits
+and looks chips up directly, instead of `floor(chip + t * f_chip) % length` in
+float64. Both advance by whole words per block, so phase continues exactly from
+one block to the next.
+
+Accuracy: the carrier phase is rounded to the nearest of `2**table_bits` levels,
+an error uniform over `+/- pi / 2**table_bits` that reduces correlations by its
+mean cosine (`phase_quantization_loss`): 0.22 dB for a 3-bit (8 level) table,
+0.0035 dB for 6 bits and 1.4e-5 dB for the default 10 bits. Frequencies are
+quantized to `f_samp / 2**32` (about 1 mHz at 4 MHz) and chipping rates to
+`f_samp / 2**32` chips per second, both negligible over a block; loops that
+steer an NCO correct the accumulated phase anyway.
+
+`benchmark_nco` compares the NCOs with the `exp`/`floor` path they replace; run
+this module to print the results.
+"""
+
+from time import perf_counter
+from numpy import arange, exp, pi, sin, log10, floor, around, asarray, broadcast_to, take, uint32, uint64, complex64
+
+PHASE_BITS = 32
+CARRIER_TABLE_BITS = 10
+CODE_FRACTION_BITS = 32
+
+carrier_tables = {}
+
+
+def carrier_table(table_bits, sign=1):
+    """
+    Returns the (shared, read-only) table of `exp(sign * 2j * pi * k / 2**table_bits)`.
+    """
+    key = (table_bits, sign)
+    if key not in carrier_tables:
+        table = exp(sign * 2j * pi * arange(2**table_bits) / 2**table_bits).astype(complex64)
+        table.setflags(write=False)
+        carrier_tables[key] = table
+    return carrier_tables[key]
+
+
+def phase_quantization_loss(table_bits=CARRIER_TABLE_BITS):
+    """
+    Returns the mean correlation loss (dB) from rounding the carrier phase to
+    `2**table_bits` levels.
+    """
+    delta = pi / 2**table_bits
+    return -20 * log10(sin(delta) / delta)
+
+
+class CarrierNCO:
+    """
+    Carrier replica `exp(1j * (phase + 2 * pi * frequency * t))` sampled at `f_samp`,
+    from a 32-bit phase accumulator and a `2**table_bits` entry table.
+
+    `samples(num_samples)` returns the next `num_samples` samples and advances the
+    phase; `sign=-1` returns the conjugate replica (for carrier wipe-off). Setting
+    `frequency` or `phase` takes effect from the next sample.
+    """
+
+    def __init__(self, f_samp, frequency=0., phase=0., table_bits=CARRIER_TABLE_BITS):
+        self.f_samp = f_samp
+        self.table_bits = table_bits
+        self.shift = uint32(PHASE_BITS - table_bits)
+        # adding half a table step before the shift rounds to the nearest entry
+        self.half_step = 1 << (PHASE_BITS - table_bits - 1)
+        self.frequency = frequency
+        self.phase = phase
+        self.ramp = arange(0, dtype=uint32)
+
+    @property
+    def frequency(self):
+        step = self.step - 2**PHASE_BITS if self.step >= 2**(PHASE_BITS - 1) else self.step
+        return step * self.f_samp / 2**PHASE_BITS
+
+    @frequency.setter
+    def frequency(self, frequency):
+        self.step = int(round(frequency / self.f_samp * 2**PHASE_BITS)) % 2**PHASE_BITS
+
+    @property
+    def phase(self):
+        return 2 * pi * self.word / 2**PHASE_BITS
+
+    @phase.setter
+    def phase(self, phase):
+        self.word = int(round(phase / (2 * pi) * 2**PHASE_BITS)) % 2**PHASE_BITS
+
+    def words(self, num_samples):
+        """
+        Returns the phase words of the next `num_samples` samples and advances the phase.
+        """
+        if len(self.ramp) != num_samples:
+            self.ramp = arange(num_samples, dtype=uint32)
+        # uint32 arithmetic wraps modulo one cycle
+        words = self.ramp * uint32(self.step) + uint32(self.word)
+        self.word = (self.word + num_samples * self.step) % 2**PHASE_BITS
+        return words
+
+    def samples(self, num_samples, sign=1):
+        words = self.words(num_samples) + uint32(self.half_step)
+        return take(carrier_table(self.table_bits, sign), words >> self.shift)
+
+
+def carrier_replicas(f_samp, frequencies, num_samples, phases=0., sign=1, table_bits=CARRIER_TABLE_BITS):
+    """
+    Returns `num_samples` samples of the carrier replicas of many `frequencies`
+    (and initial `phases`) at once, as `(len(frequencies), num_samples)`, from the
+    same phase words and table as `CarrierNCO`.
+    """
+    frequencies = asarray(frequencies, dtype=float)
+    steps = (around(frequencies / f_samp * 2**PHASE_BITS) % 2**PHASE_BITS).astype(uint32)
+    words = (around(broadcast_to(phases, frequencies.shape) / (2 * pi) * 2**PHASE_BITS) % 2**PHASE_BITS).astype(uint32)
+    words += uint32(1 << (PHASE_BITS - table_bits - 1))
+    words = arange(num_samples, dtype=uint32) * steps[:, None] + words[:, None]
+    return take(carrier_table(table_bits, sign), words >> uint32(PHASE_BITS - table_bits))
+
+
+class CodeNCO:
+    """
+    Samples of the +/-1 chips of `code` at `f_samp` and chipping rate `f_chip`,
+    starting at `chip`, from a code phase accumulator with `CODE_FRACTION_BITS`
+    fractional bits.
+
+    `samples(num_samples)` returns the next `num_samples` samples and advances the
+    code phase; `chip` reads or sets the current code phase.
+    """
+
+    def __init__(self, code, f_samp, f_chip, chip=0.):
+        self.length = len(code.sequence)
+        self.sequence = code.sequence
+        self.f_samp = f_samp
+        self.step = int(round(f_chip / f_samp * 2**CODE_FRACTION_BITS))
+        self.chip = chip
+        self.ramp = arange(0, dtype=uint64)
+
+    @property
+    def chip(self):
+        return self.word / 2**CODE_FRACTION_BITS
+
+    @chip.setter
+    def chip(self, chip):
+        self.word = int(floor((chip % self.length) * 2**CODE_FRACTION_BITS))
+
+    def indices(self, num_samples):
+        """
+        Returns the (unwrapped) chip indices of the next `num_samples` samples and
+        advances the code phase.
+        """
+        if len(self.ramp) != num_samples:
+            self.ramp = arange(num_samples, dtype=uint64)
+        indices = (self.ramp * uint64(self.step) + uint64(self.word)) >> uint64(CODE_FRACTION_BITS)
+        self.word = (self.word + num_samples * self.step) % (self.length << CODE_FRACTION_BITS)
+        return indices
+
+    def samples(self, num_samples):
+        return 1. - 2. * take(self.sequence, self.indices(num_samples), mode='wrap')
+
+
+def benchmark_nco(num_samples=2**14, repeat=200, f_samp=4.092e6):
+    """
+    Measures carrier and code replica generation for `num_samples`-sample blocks
+    with the NCOs and with the `exp`/`floor` path, and returns a dict mapping
+    (replica, path) to MSamples/s.
+    """
+    from gnss.codes import gps_l1ca
+    code = gps_l1ca(1)
+    t = arange(num_samples) / f_samp
+    f_carrier, f_chip = 1.2345678e6, code.rate * (1 + 1234.5 / 1.57542e9)
+    carrier_nco = CarrierNCO(f_samp, f_carrier, .3)
+    code_nco = CodeNCO(code, f_samp, f_chip, 123.4)
+    paths = {
+        ('carrier', 'exp'): lambda: exp(-2j * pi * f_carrier * t - 1j * .3),
+        ('carrier', 'nco'): lambda: carrier_nco.samples(num_samples, -1),
+        ('code', 'floor'): lambda: 1. - 2. * code.sequence[(floor(123.4 + t * f_chip) % code.length).astype(int)],
+        ('code', 'nco'): lambda: code_nco.samples(num_samples),
+    }
+    results = {}
+    for key, generate in paths.items():
+        best = float('inf')
+        for i in range(repeat):
+            start = perf_counter()
+            generate()
+            best = min(best, perf_counter() - start)
+        results[key] = num_samples / best / 1e6
+    return results
+
+
+if __name__ == "__main__":
+    for (replica, path), rate in benchmark_nco().items():
+        print('{0:7s} {1:5s} {2:10.1f} MSamples/s'.format(replica, path, rate))
+    for table_bits in (3, 6, CARRIER_TABLE_BITS):
+        print('{0:2d}-bit carrier table: {1:.2e} dB phase quantization loss'.format(
+            table_bits, phase_quantization_loss(table_bits)))
@@ -0,0 +1,111 @@
+"""
+Process-wide cache of sampled code replicas and their spectra.
+
+Acquisition samples the same codes at the same rates over and over, e.g. when
+reacquiring the same PRNs every few seconds of a long recording. `replica_cache` keeps the most recently used
+replicas, keyed by (signal type, svid, f_samp, number of samples, quantized
+Doppler, chip offset), up to a byte budget. Only replicas that recur belong in it,
+such as the zero-phase codes and spectra of acquisition; per-epoch tracking and
+per-candidate replicas (a new chip offset every time) call `sample_code`
+directly, so they do not evict them.
+
+Cached arrays are shared and read-only. Set `replica_cache.enabled = False` to
+always regenerate replicas.
+"""
+
+from collections import OrderedDict
+from numpy import conj, fft
+from gnss.signals.nco import CarrierNCO, CodeNCO
+
+
+def sample_code(signal, f_samp, num_samples, f_dopp=0., chip=0.):
+    """
+    Returns `num_samples` +/-1 samples of `signal.code` at sample rate `f_samp`,
+    starting at `chip` with the chipping rate adjusted for Doppler `f_dopp`.
+    """
+    f_chip = signal.code.rate * (1. + f_dopp / signal.f_carrier)
+    return CodeNCO(signal.code, f_samp, f_chip, chip).samples(num_samples)
+
+
+class ReplicaCache:
+    """
+    LRU cache of sampled code replicas and their conjugate spectra.
+
+    Doppler and carrier frequencies are quantized to `dopp_resolution` Hz and chip
+    offsets (modulo the code length) to `chip_resolution` chips; replicas are
+    generated from the quantized values. Entries are evicted, least recently used
+    first, once they hold more than `max_bytes`. `hits` and `misses` count lookups.
+
+    Signals without a `signal_type` are not cached, since (signal type, svid) is
+    what identifies the code.
+    """
+
+    def __init__(self, max_bytes=2**26, dopp_resolution=1e-3, chip_resolution=1e-6, enabled=True):
+        self.max_bytes = max_bytes
+        self.dopp_resolution = dopp_resolution
+        self.chip_resolution = chip_resolution
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, signal, f_dopp, chip, f_carrier=0.):
+        """
+        Returns the quantized `(f_dopp, chip, f_carrier)` replicas are generated from.
+        """
+        f_dopp = round(f_dopp / self.dopp_resolution) * self.dopp_resolution
+        chip = round((chip % len(signal.code.sequence)) / self.chip_resolution) * self.chip_resolution
+        f_carrier = round(f_carrier / self.dopp_resolution) * self.dopp_resolution
+        return f_dopp, chip, f_carrier
+
+    def lookup(self, key, make):
+        if not self.enabled or not key[1]:
+            return make()
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = make()
+        value.setflags(write=False)
+        if value.nbytes <= self.max_bytes:
+            self.entries[key] = value
+            self.num_bytes += value.nbytes
+            while self.num_bytes > self.max_bytes:
+                key, evicted = self.entries.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+        return value
+
+    def code_samples(self, signal, f_samp, num_samples, f_dopp=0., chip=0.):
+        """
+        Returns `sample_code(signal, f_samp, num_samples, f_dopp, chip)`, cached.
+        """
+        f_dopp, chip, f_carrier = self.quantize(signal, f_dopp, chip)
+        key = ('code', signal.signal_type, signal.svid, f_samp, num_samples, f_dopp, chip)
+        return self.lookup(key, lambda: sample_code(signal, f_samp, num_samples, f_dopp, chip))
+
+    def conjugate_spectrum(self, signal, f_samp, num_samples, f_carrier=0., f_dopp=0., chip=0.):
+        """
+        Returns the conjugate FFT of the code replica modulated on a carrier of
+        `f_carrier` Hz (relative to the sampled band), cached.
+        """
+        f_dopp, chip, f_carrier = self.quantize(signal, f_dopp, chip, f_carrier)
+        key = ('spectrum', signal.signal_type, signal.svid, f_samp, num_samples, f_dopp, chip, f_carrier)
+
+        def make():
+            reference = self.code_samples(signal, f_samp, num_samples, f_dopp, chip)
+            if f_carrier:
+                reference = reference * CarrierNCO(f_samp, f_carrier).samples(num_samples)
+            return conj(fft.fft(reference))
+        return self.lookup(key, make)
+
+
+replica_cache = ReplicaCache()
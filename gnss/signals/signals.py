@@ -15,6 +15,7 @@ class Signal:
     """
     
     def __init__(self, svid, f_carrier, code, f_nav=None, code_nav=None, signal_type='', freq_no=-8):
+        self.svid = svid
         self.f_carrier = f_carrier
         self.code = code
         self.f_nav = f_nav
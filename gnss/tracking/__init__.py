@@ -1,2 +1,5 @@
 # init for tracking module
-from gnss.tracking.tracking import code_samples, Correlator, delay_discriminator, costas_discriminator
+from gnss.tracking.tracking import code_samples, Correlator, MultiCorrelator, DenseCorrelator, delay_discriminator, \
+    costas_discriminator
+from gnss.tracking.engine import TrackingEngine, TRACKING_OUTPUT_DTYPE
+from gnss.tracking.quantized import integer_correlations, bitwise_correlations
@@ -0,0 +1,210 @@
+"""
+Tracking loop engine: carrier-aided DLLs and FLL-assisted PLLs for many channels
+over whole source buffers.
+
+`TrackingEngine` keeps the state of all channels in arrays: the carrier and code
+NCO phase words (see `gnss.signals.nco`), the loop filter states and the previous
+prompt correlations. `process` fetches every whole epoch a source buffer holds in
+one `get`, then runs the loops epoch by epoch on views of it, correlating all
+channels with preallocated sample-sized work arrays and writing per-epoch
+outputs into a `TRACKING_OUTPUT_DTYPE` array. The loop updates are numpy
+operations on per-channel arrays, which still allocate small temporaries each
+epoch, so the per-epoch cost grows with the number of channels but not with the
+block size.
+
+The loops follow the usual designs (e.g. Kaplan, ch. 5):
+
+DLL:
+    first order, `chip -= 4 * dll_bandwidth * T * delay_discriminator(E, P, L)`
+    each epoch, on top of the chipping rate aided by the carrier Doppler
+PLL:
+    second order on the `costas_discriminator` of the prompt, optionally assisted
+    by a first-order FLL on the phase change between prompts (`fll_bandwidth`),
+    steering the carrier NCO frequency
+"""
+
+import numpy
+from numpy import arange, zeros, empty, pi, sqrt, arctan, real, imag, conj, uint32, int64, intp, float32
+from gnss.signals.nco import PHASE_BITS, CARRIER_TABLE_BITS, CODE_FRACTION_BITS, carrier_table
+from gnss.tracking.tracking import delay_discriminator, costas_discriminator
+
+TRACKING_OUTPUT_DTYPE = numpy.dtype([('time', float), ('chip', float), ('f_dopp', float), ('theta', float),
+                                     ('early', 'c8'), ('prompt', 'c8'), ('late', 'c8'),
+                                     ('dll_error', float32), ('pll_error', float32), ('fll_error', float32)])
+
+
+class TrackingEngine:
+    """
+    Tracks `signals` in `source` with `block_length` second epochs and early and
+    late correlators `chip_delay` chips either side of prompt.
+
+    `start` sets the channel states (e.g. from acquisition); `process` then tracks
+    through as many whole epochs as the source holds, at most `max_epochs`
+    (default: one source buffer), and returns the `(epoch, channel)` outputs as a
+    new array, or writes them into `out`. Call it again after the source advances
+    to continue. `chip`, `f_dopp` and `theta`
+    are the current states.
+    """
+
+    __slots__ = ('source', 'signals', 'num_channels', 'block_size', 'block_length', 'chip_delay', 'dll_gain',
+                 'pll_omega', 'fll_omega', 'max_epochs', 'time', 'f_inters', 'f_carriers', 'code_rates',
+                 'code_lengths', 'margin', 'codes', 'row_offsets', 'table', 'carrier_words', 'carrier_steps',
+                 'code_words', 'code_steps', 'freq_state', 'last_prompt', 'ramp32', 'ramp64', 'carrier_work',
+                 'carrier_indices', 'carrier', 'code_work', 'code_indices', 'replicas', 'correlations', 'outputs')
+
+    def __init__(self, source, signals, block_length=1e-3, chip_delay=.5, dll_bandwidth=2., pll_bandwidth=15.,
+                 fll_bandwidth=0., max_epochs=None):
+        self.source = source
+        self.signals = list(signals)
+        self.num_channels = n = len(self.signals)
+        self.block_size = b = int(round(block_length * source.f_samp))
+        self.block_length = b / source.f_samp
+        self.chip_delay = chip_delay
+        self.dll_gain = 4. * dll_bandwidth * self.block_length
+        self.pll_omega = pll_bandwidth / .53
+        self.fll_omega = fll_bandwidth / .25
+        self.max_epochs = max_epochs or max(1, int(source.buffer_size // b))
+        self.time = None
+        self.f_carriers = numpy.asarray([signal.f_carrier for signal in self.signals])
+        self.f_inters = self.f_carriers - source.f_center
+        self.code_rates = numpy.asarray([signal.code.rate for signal in self.signals])
+        self.code_lengths = numpy.asarray([len(signal.code.sequence) for signal in self.signals], dtype=int64)
+        # code table rows hold each code from `-margin` chips through the chips one epoch can
+        # advance past its end, so delayed indices need no modulo
+        self.margin = int(numpy.ceil(chip_delay)) + 1
+        width = int(self.code_lengths.max()) + int(numpy.ceil(b * self.code_rates.max() * 1.001 / source.f_samp)) \
+            + 2 * self.margin + 1
+        self.codes = zeros((n, width), dtype=float32)
+        for i, signal in enumerate(self.signals):
+            self.codes[i] = 1. - 2. * signal.code.sequence[(arange(width) - self.margin) % len(signal.code.sequence)]
+        self.row_offsets = (arange(n, dtype=int64) * width)[:, None, None]
+        self.table = carrier_table(CARRIER_TABLE_BITS, -1)
+        self.carrier_words = zeros((n,), dtype=uint32)
+        self.carrier_steps = zeros((n,), dtype=uint32)
+        self.code_words = zeros((n,), dtype=int64)
+        self.code_steps = zeros((n,), dtype=int64)
+        self.freq_state = zeros((n,))
+        self.last_prompt = zeros((n,), dtype=complex)
+        self.ramp32 = arange(b, dtype=uint32)
+        self.ramp64 = arange(b, dtype=int64)
+        # `take` wants `intp` indices; other index types are converted on every call
+        self.carrier_work = empty((n, b), dtype=uint32)
+        self.carrier_indices = empty((n, b), dtype=intp)
+        self.carrier = empty((n, b), dtype='c8')
+        self.code_work = empty((n, b), dtype=int64)
+        self.code_indices = empty((n, 3, b), dtype=intp)
+        self.replicas = empty((n, 3, b), dtype=float32)
+        self.correlations = empty((n, 3, 2), dtype=float32)
+        self.outputs = zeros((self.max_epochs, n), dtype=TRACKING_OUTPUT_DTYPE)
+
+    @property
+    def chip(self):
+        return self.code_words / 2.**CODE_FRACTION_BITS
+
+    @property
+    def f_dopp(self):
+        return self.freq_state / (2 * pi)
+
+    @property
+    def theta(self):
+        return 2 * pi * self.carrier_words / 2.**PHASE_BITS
+
+    def start(self, time, chips, f_dopps, thetas=0.):
+        """
+        Sets the channels' code phases `chips`, Doppler `f_dopps` and carrier phases
+        `thetas` at `time`. Tracking starts at the nearest sample.
+        """
+        start = int(round(time * self.source.f_samp))
+        self.time = start / self.source.f_samp
+        f_dopps = numpy.broadcast_to(numpy.asarray(f_dopps, dtype=float), (self.num_channels,))
+        chips = numpy.asarray(chips, dtype=float) + (self.time - time) * self.code_rates * (1. + f_dopps / self.f_carriers)
+        self.code_words[:] = numpy.floor((chips % self.code_lengths) * 2.**CODE_FRACTION_BITS)
+        thetas = numpy.broadcast_to(numpy.asarray(thetas, dtype=float), (self.num_channels,))
+        self.carrier_words[:] = numpy.round(thetas / (2 * pi) * 2.**PHASE_BITS) % 2**PHASE_BITS
+        self.freq_state[:] = 2 * pi * f_dopps
+        self.last_prompt[:] = 0.
+        self.steer(self.freq_state)
+
+    def steer(self, omega):
+        """
+        Sets the NCO rates for carrier Doppler `omega` (rad/s).
+        """
+        f_samp = self.source.f_samp
+        f_dopps = omega / (2 * pi)
+        self.carrier_steps[:] = numpy.round((self.f_inters + f_dopps) / f_samp * 2.**PHASE_BITS) % 2**PHASE_BITS
+        # carrier aiding: the code Doppler follows the carrier Doppler
+        self.code_steps[:] = numpy.round(self.code_rates * (1. + f_dopps / self.f_carriers) / f_samp
+                                         * 2.**CODE_FRACTION_BITS)
+
+    def correlate(self, block):
+        """
+        Correlates all channels with `block` at the current NCO states and returns
+        the `(channel, tap)` early, prompt and late correlations.
+        """
+        work, carrier = self.carrier_work, self.carrier
+        numpy.multiply(self.ramp32, self.carrier_steps[:, None], out=work)
+        numpy.add(work, (self.carrier_words + uint32(1 << (PHASE_BITS - CARRIER_TABLE_BITS - 1)))[:, None], out=work)
+        numpy.right_shift(work, uint32(PHASE_BITS - CARRIER_TABLE_BITS), out=self.carrier_indices)
+        numpy.take(self.table, self.carrier_indices, out=carrier, mode='clip')
+        numpy.multiply(carrier, block, out=carrier)
+        code_work, code_indices = self.code_work, self.code_indices
+        numpy.multiply(self.ramp64, self.code_steps[:, None], out=code_work)
+        numpy.add(code_work, self.code_words[:, None], out=code_work)
+        for j, delay in enumerate((-self.chip_delay, 0., self.chip_delay)):
+            offset = int(round((self.margin + delay) * 2**CODE_FRACTION_BITS))
+            numpy.add(code_work, offset, out=code_indices[:, j])
+        numpy.right_shift(code_indices, CODE_FRACTION_BITS, out=code_indices)
+        numpy.add(code_indices, self.row_offsets, out=code_indices)
+        numpy.take(self.codes, code_indices, out=self.replicas, mode='clip')
+        # real and imaginary parts at once: (channel, tap, sample) x (channel, sample, re/im)
+        numpy.matmul(self.replicas, carrier.view(float32).reshape((self.num_channels, self.block_size, 2)),
+                     out=self.correlations)
+        return self.correlations.view('c8')[:, :, 0]
+
+    def process(self, num_epochs=None, out=None):
+        """
+        Tracks through the next `num_epochs` epochs (default: all whole epochs left
+        in the source, at most `max_epochs`) and returns their outputs.
+
+        The outputs are a copy that later calls leave alone. If `out` (a
+        `TRACKING_OUTPUT_DTYPE` array of shape `(epochs, channels)`) is given, they
+        are written into it instead, at most `len(out)` epochs, and the filled
+        leading rows of `out` are returned.
+        """
+        f_samp = self.source.f_samp
+        b = self.block_size
+        available = int(round((self.source.max_time - self.time) * f_samp)) // b - 1
+        num_epochs = min(available if num_epochs is None else num_epochs, self.max_epochs)
+        outputs = self.outputs if out is None else out
+        num_epochs = min(num_epochs, len(outputs))
+        if num_epochs <= 0:
+            return outputs[:0].copy() if out is None else outputs[:0]
+        samples, time = self.source.get(num_epochs * b, self.time)
+        t = self.block_length
+        pll_gain, pll_omega_sq, fll_omega = sqrt(2.) * self.pll_omega, self.pll_omega**2, self.fll_omega
+        code_period_words = self.code_lengths << CODE_FRACTION_BITS
+        for k in range(num_epochs):
+            row = outputs[k]
+            row['time'] = time + k * t
+            row['chip'] = self.code_words / 2.**CODE_FRACTION_BITS
+            row['f_dopp'] = self.freq_state / (2 * pi)
+            row['theta'] = 2 * pi * self.carrier_words / 2.**PHASE_BITS
+            taps = self.correlate(samples[k * b:(k + 1) * b])
+            early, prompt, late = taps[:, 0], taps[:, 1], taps[:, 2]
+            row['early'], row['prompt'], row['late'] = early, prompt, late
+            dll_error = delay_discriminator(early, prompt, late, self.chip_delay)
+            pll_error = costas_discriminator(prompt)
+            # phase change between prompts (insensitive to data bits), as a frequency in rad/s
+            cross, dot = imag(conj(self.last_prompt) * prompt), real(conj(self.last_prompt) * prompt)
+            fll_error = numpy.where(dot != 0., arctan(cross / numpy.where(dot != 0., dot, 1.)) / t, 0.)
+            self.last_prompt[:] = prompt
+            row['dll_error'], row['pll_error'], row['fll_error'] = dll_error, pll_error, fll_error
+            # advance the NCOs over the epoch, then apply the loop corrections
+            self.carrier_words += self.carrier_steps * uint32(b)
+            self.code_words += self.code_steps * b
+            self.code_words -= numpy.round(self.dll_gain * dll_error * 2.**CODE_FRACTION_BITS).astype(int64)
+            self.code_words %= code_period_words
+            self.freq_state += t * (pll_omega_sq * pll_error + fll_omega * fll_error)
+            self.steer(self.freq_state + pll_gain * pll_error)
+        self.time = time + num_epochs * t
+        return outputs[:num_epochs].copy() if out is None else outputs[:num_epochs]
@@ -1,33 +1,244 @@
 
 import numpy
+from gnss.signals.nco import CarrierNCO, CodeNCO, carrier_replicas
+from gnss.tracking import quantized
 
 
 def code_samples(signal, f_dopp, t, chip=0.):
+    """
+    Samples the code of `signal` at the uniformly spaced times `t`, from `chip` at
+    `t = 0`.
+    """
     f_chip = signal.code.rate * (1. + f_dopp / signal.f_carrier)
-    return 1. - 2. * signal.code.sequence[(numpy.floor(chip + t * f_chip) % len(signal.code.sequence)).astype(int)]
+    f_samp = 1. / (t[1] - t[0]) if len(t) > 1 else 1.
+    return CodeNCO(signal.code, f_samp, f_chip, chip + t[0] * f_chip).samples(len(t))
 
 
 class Correlator:
-    
-    def __init__(self, chip_delays=[-.5, 0., .5], doppler_offsets=[]):
+    """
+    Correlates a block of samples with the code and carrier replicas of a signal at
+    each of `chip_delays` and, with the prompt code, at each of `doppler_offsets`.
+
+    `mode` selects the arithmetic: 'float' (complex samples and float replicas),
+    'integer' (`int8` samples, quantized carrier and integer accumulation) or
+    'bitwise' (sign/magnitude bit planes, XOR and popcount), see
+    `gnss.tracking.quantized`. The integer modes model fixed-point correlation of
+    recordings of few bits per component and take the `int8` samples of sources
+    opened with `integer=True` as they are; float samples are clipped to
+    `sample_bits` bits. `threshold` sets the magnitude threshold of the bit planes
+    (default: the RMS of each block). Correlations of all modes are on (roughly,
+    for 'bitwise') the same scale, the integer modes losing only the quantization
+    of carrier (and, bitwise, sample) levels.
+    """
+
+    def __init__(self, chip_delays=[-.5, 0., .5], doppler_offsets=[], mode='float', sample_bits=8, threshold=None):
+        if mode not in ('float', 'integer', 'bitwise'):
+            raise ValueError('`mode` must be one of \'float\', \'integer\' or \'bitwise\'')
         self.chip_delays = chip_delays
         self.doppler_offsets = doppler_offsets
+        self.mode = mode
+        self.sample_bits = sample_bits
+        self.threshold = threshold
+        if mode == 'integer':
+            self.carrier_gain = quantized.carrier_gain(quantized.integer_carrier_table())
+        elif mode == 'bitwise':
+            self.carrier_gain = quantized.carrier_gain(quantized.quadrant_carrier_table())
     
     def correlate(self, signal, source, block_size, time, chip, f_dopp, theta):
         samples, time = source.get(block_size, time)
         # TODO handle changes in time
-        t = numpy.arange(block_size) / source.f_samp
-        f_inter = signal.f_carrier - source.f_center
-        carrierless = samples * numpy.exp(-2j * numpy.pi * (f_inter + f_dopp) * t - 1j * theta)
-        codeless = samples * code_samples(signal, f_dopp, t, chip)
-        chip_delay_outputs = (numpy.sum(carrierless * code_samples(signal, f_dopp, t, chip + delay)) \
-                              for delay in self.chip_delays)
-        doppler_offset_outputs = (np.sum(codeless \
-                    * numpy.exp(-2j * numpy.pi * (f_inter + f_dopp + dopp_offset) * t - 1j * theta)) \
+        return self.correlate_block(signal, samples[:block_size], source.f_samp, signal.f_carrier - source.f_center,
+                                    chip, f_dopp, theta)
+
+    def correlate_block(self, signal, samples, f_samp, f_inter, chip, f_dopp, theta):
+        """
+        Correlates `samples` at sampling rate `f_samp` and intermediate frequency
+        `f_inter` and returns the chip delay outputs and the Doppler offset outputs.
+        """
+        block_size = len(samples)
+        if self.mode != 'float':
+            return self.correlate_quantized(signal, samples, f_samp, f_inter, chip, f_dopp, theta)
+        carrierless = samples * CarrierNCO(f_samp, f_inter + f_dopp, theta).samples(block_size, -1)
+        # one code NCO ramp for all taps; the chips change every block, so these
+        # replicas are not worth caching
+        num_delays = len(self.chip_delays)
+        delays = list(self.chip_delays) + [0.] * min(1, len(self.doppler_offsets))
+        codes = quantized.code_taps(signal, f_samp, block_size, f_dopp, chip, delays, 1. - 2. * signal.code.sequence)
+        codeless = samples * codes[-1] if len(self.doppler_offsets) else None
+        chip_delay_outputs = (numpy.sum(carrierless * code) for code in codes[:num_delays])
+        doppler_offset_outputs = (numpy.sum(codeless \
+                    * CarrierNCO(f_samp, f_inter + f_dopp + dopp_offset, theta).samples(block_size, -1)) \
                     for dopp_offset in self.doppler_offsets)
         return chip_delay_outputs, doppler_offset_outputs
-    
-    
+
+    def correlate_quantized(self, signal, samples, f_samp, f_inter, chip, f_dopp, theta):
+        block_size = len(samples)
+        delays = list(self.chip_delays) + [0.] * min(1, len(self.doppler_offsets))
+        frequencies = [f_inter + f_dopp] + [f_inter + f_dopp + offset for offset in self.doppler_offsets]
+        words = [quantized.carrier_words(f_samp, frequency, theta, block_size) for frequency in frequencies]
+        num_delays = len(self.chip_delays)
+        if self.mode == 'integer':
+            components = quantized.integer_components(samples, self.sample_bits)
+            codes = quantized.code_taps(signal, f_samp, block_size, f_dopp, chip, delays,
+                                        1 - 2 * signal.code.sequence.astype(numpy.int32))
+            scale = self.carrier_gain
+            chip_delay_outputs = quantized.integer_correlations(components, quantized.integer_carrier(words[0]),
+                                                                codes[:num_delays]) / scale
+            doppler_offset_outputs = [quantized.integer_correlations(components, quantized.integer_carrier(w),
+                                                                     codes[num_delays:])[0] / scale
+                                      for w in words[1:]]
+        else:
+            planes, threshold = quantized.sign_magnitude_planes(samples, self.threshold)
+            code_planes = quantized.pack_words(quantized.code_taps(signal, f_samp, block_size, f_dopp, chip, delays))
+            # the sample levels 1 and `MAGNITUDE_WEIGHT` stand for components about
+            # half and one and a half `threshold` in size
+            scale = self.carrier_gain * 2. / threshold
+            chip_delay_outputs = quantized.bitwise_correlations(planes, quantized.quadrant_carrier_planes(words[0]),
+                                                                code_planes[:num_delays], block_size) / scale
+            doppler_offset_outputs = [quantized.bitwise_correlations(planes, quantized.quadrant_carrier_planes(w),
+                                                                     code_planes[num_delays:], block_size)[0] / scale
+                                      for w in words[1:]]
+        return list(chip_delay_outputs), doppler_offset_outputs
+
+
+class MultiCorrelator:
+    """
+    Correlates the tracking replicas of many channels with one shared block of
+    `block_size` samples of `source` per call.
+
+    `correlate` takes the channel states as arrays (`chips`, `f_dopps`, `thetas`)
+    and returns an `(N, len(chip_delays) + len(doppler_offsets))` complex array: the
+    correlations at each chip delay (e.g. early, prompt, late) followed by the
+    prompt correlations at each Doppler offset. The samples and time base are
+    fetched and built once for all channels and the Doppler-offset correlations
+    share one steering matrix. Carriers of all channels are looked up at once from
+    the NCO table (see `gnss.signals.nco`), and codes are gathered from one table
+    of all channels' codes, so the cost of a channel is a few array rows rather
+    than a call.
+    """
+
+    def __init__(self, source, block_size, chip_delays=[-.5, 0., .5], doppler_offsets=[]):
+        self.source = source
+        self.block_size = block_size
+        self.chip_delays = numpy.asarray(chip_delays, dtype=float)
+        self.doppler_offsets = numpy.asarray(doppler_offsets, dtype=float)
+        self.t = numpy.arange(block_size) / source.f_samp
+        self.steering = numpy.exp(-2j * numpy.pi * numpy.outer(self.t, self.doppler_offsets))
+        self.signals = None
+        self.margin = 0
+        self.time = None
+
+    def code_table(self, signals, margin):
+        """
+        Stacks the +/-1 code sequences of `signals` into rows, each extended by
+        `margin` chips of wrap-around on both sides, and returns the table and the
+        code lengths. The previous table is reused while the channels' signals are
+        unchanged.
+        """
+        if self.signals is None or len(signals) != len(self.signals) or margin > self.margin or \
+                any(a is not b for a, b in zip(signals, self.signals)):
+            self.signals = list(signals)
+            self.margin = margin
+            self.code_lengths = numpy.asarray([len(signal.code.sequence) for signal in signals])
+            self.codes = numpy.zeros((len(signals), self.code_lengths.max() + 2 * margin))
+            for i, signal in enumerate(signals):
+                indices = numpy.arange(-margin, self.code_lengths[i] + margin) % self.code_lengths[i]
+                self.codes[i, :self.code_lengths[i] + 2 * margin] = 1. - 2. * signal.code.sequence[indices]
+        return self.codes, self.code_lengths
+
+    def correlate(self, signals, time, chips, f_dopps, thetas, chip_delays=None):
+        """
+        `chip_delays`, if given, overrides the correlator delays, either shared or
+        one row per channel.
+        """
+        samples, self.time = self.source.get(self.block_size, time)
+        samples = samples[:self.block_size]
+        num_channels = len(signals)
+        chips, f_dopps, thetas = (numpy.asarray(x, dtype=float) for x in (chips, f_dopps, thetas))
+        delays = self.chip_delays if chip_delays is None else numpy.asarray(chip_delays, dtype=float)
+        delays = numpy.broadcast_to(delays, (num_channels, delays.shape[-1]))
+        num_delays = delays.shape[1]
+        if len(self.doppler_offsets):
+            # the Doppler-offset correlations despread with the undelayed (prompt) code
+            delays = numpy.hstack((delays, numpy.zeros((num_channels, 1))))
+        f_carriers = numpy.asarray([signal.f_carrier for signal in signals])
+        f_chips = numpy.asarray([signal.code.rate for signal in signals]) * (1. + f_dopps / f_carriers)
+        f_inters = f_carriers - self.source.f_center + f_dopps
+        carrierless = samples * carrier_replicas(self.source.f_samp, f_inters, self.block_size, thetas, -1)
+        # (channel, delay, sample) indices into the flattened code table; the margin
+        # keeps delayed chips of the code period in range without another modulo
+        margin = int(numpy.ceil(numpy.absolute(delays).max())) + 1
+        codes, code_lengths = self.code_table(signals, margin)
+        code_chips = (chips[:, None] + numpy.outer(f_chips, self.t)) % code_lengths[:, None]
+        code_chips += (numpy.arange(num_channels) * codes.shape[1] + self.margin)[:, None]
+        replicas = codes.ravel()[(code_chips[:, None, :] + delays[:, :, None]).astype(numpy.intp)]
+        outputs = numpy.zeros((num_channels, num_delays + len(self.doppler_offsets)), dtype=complex)
+        outputs[:, :num_delays] = numpy.matmul(replicas[:, :num_delays], carrierless[:, :, None])[:, :, 0]
+        if len(self.doppler_offsets):
+            outputs[:, num_delays:] = (replicas[:, -1] * carrierless).dot(self.steering)
+        return outputs
+
+
+class DenseCorrelator:
+    """
+    Samples the carrier-wiped correlation function of a signal at many
+    `chip_delays` (default: 101 taps over +/-1.5 chips), e.g. for multipath or
+    signal quality monitoring, from blocks of `block_size` samples of `source`.
+
+    Rather than one replica and dot product per tap, each block is accumulated
+    once into running sums of its carrier-wiped samples. A code replica is constant
+    within a chip, so its correlation at any delay is a sum over the code's chip
+    transitions of the running sum up to the first sample past each transition,
+    which interpolates between samples exactly as a delayed replica would. A tap
+    then costs a gather per transition (about half the chips in a block) instead
+    of a replica and a product per sample, and the results equal `Correlator`'s.
+    """
+
+    def __init__(self, source, block_size, chip_delays=None):
+        self.source = source
+        self.block_size = block_size
+        if chip_delays is None:
+            chip_delays = numpy.linspace(-1.5, 1.5, 101)
+        self.chip_delays = numpy.asarray(chip_delays, dtype=float)
+        self.time = None
+
+    def correlate(self, signal, time, chips, f_dopps, thetas, out=None):
+        """
+        Correlates the consecutive blocks from `time` on, one per element of
+        `chips`, `f_dopps` and `thetas` (the code phase, Doppler and carrier phase at
+        the start of each block, e.g. a channel's columns of `TrackingEngine`
+        outputs; scalars give one block), and returns the `(epoch, tap)`
+        correlations, written into `out` if given (e.g. rows of an output buffer).
+        """
+        chips, f_dopps, thetas = numpy.broadcast_arrays(*(numpy.atleast_1d(numpy.asarray(x, dtype=float))
+                                                          for x in (chips, f_dopps, thetas)))
+        num_epochs, b = len(chips), self.block_size
+        samples, self.time = self.source.get(num_epochs * b, time)
+        samples = samples[:num_epochs * b].reshape((num_epochs, b))
+        f_inters = signal.f_carrier - self.source.f_center + f_dopps
+        # running sums, `sums[:, n]` of the first `n` wiped samples of each block
+        sums = numpy.zeros((num_epochs, b + 1), dtype=complex)
+        numpy.cumsum(samples * carrier_replicas(self.source.f_samp, f_inters, b, thetas, -1), axis=1, out=sums[:, 1:])
+        steps = signal.code.rate * (1. + f_dopps / signal.f_carrier) / self.source.f_samp
+        delays = self.chip_delays[:, None]
+        if out is None:
+            out = numpy.empty((num_epochs, len(self.chip_delays)), dtype=complex)
+        for k in range(num_epochs):
+            # every chip any tap reaches over the block
+            first = numpy.floor(chips[k] + delays.min())
+            last = numpy.floor(chips[k] + delays.max() + (b - 1) * steps[k])
+            j = numpy.arange(first, last + 1)
+            code = 1. - 2. * numpy.take(signal.code.sequence, j.astype(numpy.intp), mode='wrap')
+            # sum_j code[j] * (sums[start of chip j + 1] - sums[start of chip j]),
+            # regrouped by the code changes at each chip start
+            changes = code[:-1] - code[1:]
+            transitions = numpy.flatnonzero(changes)
+            starts = numpy.ceil((j[1:][transitions] - chips[k] - delays) / steps[k])
+            starts = numpy.clip(starts, 0, b).astype(numpy.intp)
+            out[k] = sums[k, starts].dot(changes[transitions]) + code[-1] * sums[k, b]
+        return out
+
+
 def delay_discriminator(early, prompt, late, delay=.5):
     return delay * (numpy.abs(early) - numpy.abs(late)) / (numpy.abs(late) + numpy.abs(early) + 2 * numpy.abs(prompt))
 
@@ -3,16 +3,16 @@ import numpy
 npmax = numpy.max
 from numpy import ones, uint8, uint32, arange, angle, unwrap
 from bokeh.plotting import figure
-from gnss.acquisition import CoarseAcquirer, CoarseAcquirerLowMem, FineAcquirer
+from gnss.acquisition import CoarseAcquirer, CoarseAcquirerLowMem, CoarseAcquirerStreaming, FineAcquirer
 
 def plot_coarse_acquisition_results(acq):
-    if type(acq) is CoarseAcquirerLowMem:
+    if type(acq) is CoarseAcquirerLowMem or (type(acq) is CoarseAcquirerStreaming and acq.plot_corr is None):
         dopp_min, dopp_max = acq.dopp_bins[0], acq.dopp_bins[-1]
         p = figure(title='correlation', x_range=[dopp_min, dopp_max], 
                 x_axis_label='doppler (Hz)', y_axis_label='correlation strength')
         p.line(acq.dopp_bins, acq.corr_max)
         return p
-    elif type(acq) is CoarseAcquirer:
+    elif type(acq) in (CoarseAcquirer, CoarseAcquirerStreaming):
         c1, c2 = acq.plot_code_window
         r, c = acq.plot_corr.shape
         img = ones((r, c), dtype=uint32)
@@ -20,7 +20,11 @@ def plot_coarse_acquisition_results(acq):
         view[:, :, 0] = (acq.plot_corr / npmax(acq.plot_corr) * 255).astype(uint8)
         view[:, :, 1] = (acq.plot_corr / npmax(acq.plot_corr) * 128).astype(uint8)
         view[:, :, 3] = (acq.plot_corr / npmax(acq.plot_corr) * 255).astype(uint8)
-        dopp_min, dopp_max = acq.dopp_bins[0], acq.dopp_bins[-1]
+        if type(acq) is CoarseAcquirerStreaming:
+            b1, b2 = acq.plot_dopp_window
+            dopp_min, dopp_max = acq.dopp_bins[b1], acq.dopp_bins[b2 - 1]
+        else:
+            dopp_min, dopp_max = acq.dopp_bins[0], acq.dopp_bins[-1]
         p = figure(title='correlation', x_range=[c1, c2], y_range=[dopp_min, dopp_max], 
                 x_axis_label='code phase (samples)', y_axis_label='doppler (Hz)')
         p.image_rgba(image=[img], x=[c1], y=[dopp_min], dw=[c2 - c1], dh=[dopp_max - dopp_min])
@@ -0,0 +1,24 @@
+import numpy
+import pytest
+from gnss.receiver import RingBufferSource
+
+
+@pytest.fixture
+def simulated_source():
+    """
+    Returns a function that makes a `RingBufferSource` holding `duration` seconds of
+    `signal` at Doppler `f_dopp`, code delay `delay` (s) and amplitude `amplitude` in
+    unit-variance complex noise.
+    """
+    def simulate(signal, f_samp, f_center, f_dopp, delay, duration, amplitude, seed=0):
+        num_samples = int(f_samp * duration)
+        t = numpy.arange(num_samples) / f_samp
+        rng = numpy.random.default_rng(seed)
+        samples = (rng.normal(size=num_samples) + 1j * rng.normal(size=num_samples)) / numpy.sqrt(2)
+        chips = (delay + t * (1. + f_dopp / signal.f_carrier)) * signal.code.rate
+        code = 1. - 2. * signal.code.sequence[(numpy.floor(chips) % signal.code.length).astype(int)]
+        samples += amplitude * code * numpy.exp(2j * numpy.pi * (signal.f_carrier - f_center + f_dopp) * t + .3j)
+        source = RingBufferSource(f_samp, f_center, num_samples, 8, False)
+        source.write(samples.astype(numpy.complex64))
+        return source
+    return simulate
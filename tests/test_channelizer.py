@@ -0,0 +1,23 @@
+import numpy
+from gnss.receiver import Channelizer, FileSource, MemoryMappedFileSource
+
+
+def channelize(source):
+    """
+    Returns the samples of one channel split off `source` by `Channelizer.update`.
+    """
+    channelizer = Channelizer(source, chunk_size=4096)
+    channel = channelizer.add_channel(source.f_center + 3e5, 4, buffer_size=5000)
+    channelizer.update()
+    return channel.get_samples(channel.start_index, channel.end_index - channel.start_index)
+
+
+def test_channelize_memory_mapped_source(tmp_path):
+    packed = numpy.random.default_rng(0).integers(0, 256, 20000).astype(numpy.uint8)
+    filepath = str(tmp_path / 'recording.bin')
+    packed.tofile(filepath)
+    reference_source = FileSource(filepath, 4e6, 1.5e9, 4, False)
+    reference_source.load()
+    samples = channelize(MemoryMappedFileSource(filepath, 4e6, 1.5e9, 4, False, window_size=3000))
+    assert len(samples) == 5000
+    numpy.testing.assert_array_equal(samples, channelize(reference_source))
@@ -0,0 +1,28 @@
+import numpy
+from gnss.signals import Signal
+from gnss.acquisition import CoarseAcquirerBatch, CoarseAcquirerStreaming
+
+
+def test_batch_finds_signal_between_single_block_bins(simulated_source):
+    # 46 dB-Hz, 234 Hz from the nearest bin of a 2 ms grid
+    f_samp, f_dopp, delay = 4.092e6, 1234., 2.5e-4
+    signal = Signal.GPSL1CA(5)
+    source = simulated_source(signal, f_samp, signal.f_carrier - 1.2e6, f_dopp, delay, .01,
+                              numpy.sqrt(10**4.6 / f_samp))
+    results = CoarseAcquirerBatch(source, 2e-3, 4).acquire([signal, Signal.GPSL1CA(6)])
+    assert abs(results['f_dopp'][0] - f_dopp) <= 1. / 8e-3 / 2
+    assert abs(results['chip'][0] - delay * signal.code.rate) < 1.
+    assert results['snr'][0] > results['snr'][1]
+
+
+def test_streaming_finds_code_longer_than_block(simulated_source):
+    # 0.5 ms blocks of the 1 ms C/A code: only the first half of the code phases is
+    # searched, but chips still follow from the samples in a whole code period
+    f_samp, f_dopp, chip = 4.092e6, 1000., 800.
+    signal = Signal.GPSL1CA(5)
+    source = simulated_source(signal, f_samp, signal.f_carrier - 1.2e6, f_dopp, chip / signal.code.rate, .01,
+                              numpy.sqrt(10**4.8 / f_samp))
+    acquirer = CoarseAcquirerStreaming(source, 5e-4, 8)
+    acquirer.acquire(signal, 0.)
+    assert abs(acquirer.f_dopp - f_dopp) <= 1. / 5e-4
+    assert abs(acquirer.chip - chip) < 1.
@@ -0,0 +1,21 @@
+import warnings
+import numpy
+from gnss.receiver import FileSource
+from gnss.receiver.unpacking import SampleUnpacker
+from gnss.filters.fir_filter import PolyphaseDecimator
+
+
+def test_real_source_with_decimation(tmp_path):
+    packed = numpy.random.default_rng(0).integers(0, 256, 16000).astype(numpy.uint8)
+    filepath = str(tmp_path / 'recording.bin')
+    packed.tofile(filepath)
+    source = FileSource(filepath, 4e6, 0., 8, True, buffer_size=2000, decimation=4)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        source.load()
+        source.advance(500)
+    assert source.buffer.dtype == numpy.float32
+    # the same samples decimated as complex have the real result as real part
+    decimator = PolyphaseDecimator(4)
+    expected = decimator.process(SampleUnpacker(8, True).unpack(packed).astype(numpy.complex64))
+    numpy.testing.assert_allclose(source.buffer, expected[1500:3500].real, atol=1e-4)
@@ -0,0 +1,22 @@
+import numpy
+from gnss.signals import Signal
+from gnss.tracking import TrackingEngine, TRACKING_OUTPUT_DTYPE
+
+F_SAMP = 4.092e6
+
+
+def test_outputs_survive_later_calls(simulated_source):
+    signal = Signal.GPSL1CA(3)
+    delay, f_dopp = 2.345e-4, 1234.5
+    source = simulated_source(signal, F_SAMP, signal.f_carrier - 1e6, f_dopp, delay, .02, .2)
+    engine = TrackingEngine(source, [signal])
+    engine.start(0., (delay * signal.code.rate) % signal.code.length, f_dopp)
+    first = engine.process(5)
+    kept = first.copy()
+    second = engine.process(5)
+    numpy.testing.assert_array_equal(first, kept)
+    assert second['time'][0, 0] > first['time'][-1, 0]
+    out = numpy.zeros((3, 1), dtype=TRACKING_OUTPUT_DTYPE)
+    filled = engine.process(out=out)
+    assert len(filled) == 3 and numpy.shares_memory(filled, out)
+    assert out['time'][0, 0] > second['time'][-1, 0]
@@ -0,0 +1,35 @@
+import numpy
+from gnss.signals import Signal
+from gnss.acquisition import FineAcquirer
+
+F_SAMP = 4.092e6
+
+
+def acquire(source, signal, block_length, separation_length, num_blocks, chip, f_dopp):
+    acquirer = FineAcquirer(source, block_length, separation_length, num_blocks)
+    acquirer.acquire(signal, 0., chip, f_dopp)
+    return acquirer
+
+
+def test_overlapping_blocks(simulated_source):
+    signal = Signal.GPSL1CA(3)
+    delay, f_dopp = 2.345e-4, 1234.5
+    source = simulated_source(signal, F_SAMP, signal.f_carrier - 1e6, f_dopp, delay, .04, .2)
+    chip = (delay * signal.code.rate) % signal.code.length
+    # the blocks the tracking notebooks use: 2 ms long, starting 1 ms apart
+    acquirer = acquire(source, signal, 2e-3, 1e-3, 29, chip, f_dopp + 40.)
+    assert abs(acquirer.f_dopp - f_dopp) < 1.
+    assert acquirer.residual < .2
+
+
+def test_block_sums_match_adjacent_blocks(simulated_source):
+    signal = Signal.GPSL1CA(3)
+    delay, f_dopp = 2.345e-4, 1234.5
+    source = simulated_source(signal, F_SAMP, signal.f_carrier - 1e6, f_dopp, delay, .04, .2)
+    chip, guess = (delay * signal.code.rate) % signal.code.length, f_dopp + 10.
+    adjacent = acquire(source, signal, 1e-3, 1e-3, 10, chip, guess).phases
+    overlapping = acquire(source, signal, 2e-3, 1e-3, 9, chip, guess).phases
+    gapped = acquire(source, signal, 1e-3, 2e-3, 5, chip, guess).phases
+    scale = numpy.absolute(adjacent).max()
+    assert numpy.absolute(overlapping - (adjacent[:-1] + adjacent[1:])).max() < 1e-6 * scale
+    assert numpy.absolute(gapped - adjacent[::2]).max() < 1e-6 * scale
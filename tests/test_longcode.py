@@ -0,0 +1,16 @@
+import numpy
+from gnss.signals import Signal
+from gnss.acquisition import LongCodeAcquirer
+
+
+def test_overlay_resolved_at_half_bin_doppler(simulated_source):
+    signal = Signal.GPSL5_I(7)
+    delay, f_dopp = .3713456789, 1500.
+    source = simulated_source(signal, 20.46e6, signal.f_carrier - 1e6, f_dopp, delay, .06, .05)
+    # 200 Hz bins: the true Doppler lies halfway between the 1400 and 1600 Hz bins
+    acquirer = LongCodeAcquirer(source, num_blocks=5, dopp_bins=numpy.arange(1000., 2001., 200.))
+    acquirer.acquire(signal, 0.)
+    truth = (delay * signal.code.rate) % signal.code.length
+    error = (acquirer.chip - truth + signal.code.length / 2) % signal.code.length - signal.code.length / 2
+    assert abs(error) < 1.
+    assert abs(acquirer.f_dopp - f_dopp) < 50.
@@ -0,0 +1,28 @@
+import pickle
+import numpy
+from gnss.signals import Signal
+from gnss.acquisition import ParallelAcquirer
+
+F_SAMP = 2.046e6
+
+
+def test_signals_are_sent_to_workers_once(simulated_source, monkeypatch):
+    signal = Signal.GPSL1CA(5)
+    delay, f_dopp = 2.5e-4, 2000.
+    source = simulated_source(signal, F_SAMP, signal.f_carrier, f_dopp, delay, .01, numpy.sqrt(10**4.8 / F_SAMP))
+    signals = [Signal.GPSL1CA(3), signal]
+    submitted = []
+    with ParallelAcquirer(source, 1e-3, 4, num_workers=2) as acquirer:
+        results = acquirer.acquire(signals, 0.)
+        executor = acquirer.executor
+        submit = executor.submit
+        monkeypatch.setattr(executor, 'submit', lambda *args: submitted.append(pickle.dumps(args)) or submit(*args))
+        again = acquirer.acquire(signals, 0.)
+        assert acquirer.executor is executor
+        acquirer.acquire(signals[1:], 0.)
+        assert acquirer.executor is not executor
+    assert results[1]['f_dopp'] == f_dopp
+    assert abs(results[1]['chip'] - delay * signal.code.rate) < 1.
+    numpy.testing.assert_array_equal(again, results)
+    # units carry a signal index, not the signal and its code
+    assert submitted and max(len(unit) for unit in submitted) < signal.code.sequence.nbytes
@@ -0,0 +1,47 @@
+import numpy
+import pytest
+from gnss.signals import Signal
+from gnss.receiver import RingBufferSource
+from gnss.receiver.unpacking import SampleUnpacker
+from gnss.tracking import Correlator
+
+
+def packed_recording(signal, f_samp, f_inter, f_dopp, chip, num_samples, seed=0):
+    """
+    Returns 4-bit complex samples of `signal` in noise, packed one sample per byte.
+    """
+    t = numpy.arange(num_samples) / f_samp
+    rng = numpy.random.default_rng(seed)
+    chips = chip + t * signal.code.rate * (1. + f_dopp / signal.f_carrier)
+    code = 1. - 2. * signal.code.sequence[(numpy.floor(chips) % signal.code.length).astype(int)]
+    samples = rng.normal(size=num_samples) + 1j * rng.normal(size=num_samples)
+    samples += .5 * code * numpy.exp(2j * numpy.pi * (f_inter + f_dopp) * t + .3j)
+    components = numpy.clip(numpy.around(2 * numpy.stack((samples.real, samples.imag), axis=1)), -8, 7)
+    nibbles = components.astype(numpy.int8).view(numpy.uint8) & 15
+    return (nibbles[:, 0] | nibbles[:, 1] << 4).astype(numpy.uint8)
+
+
+@pytest.mark.parametrize('mode', ['integer', 'bitwise'])
+def test_integer_source_feeds_quantized_modes(mode):
+    signal, f_samp, f_inter, f_dopp, chip = Signal.GPSL1CA(3), 4.092e6, 1.2e6, 850., 301.3
+    packed = packed_recording(signal, f_samp, f_inter, f_dopp, chip, 4092)
+    source = RingBufferSource(f_samp, signal.f_carrier - f_inter, len(packed), 4, False, integer=True)
+    source.write(source.unpacker.unpack(packed))
+    samples = SampleUnpacker(4, False).unpack(packed)
+    correlator = Correlator(mode=mode, doppler_offsets=[-100., 100.])
+    outputs = correlator.correlate(signal, source, len(packed), 0., chip, f_dopp, 0.)
+    expected = correlator.correlate_block(signal, samples, f_samp, f_inter, chip, f_dopp, 0.)
+    numpy.testing.assert_array_equal(outputs[0], list(expected[0]))
+    numpy.testing.assert_array_equal(outputs[1], list(expected[1]))
+
+
+def test_integer_mode_matches_float_mode():
+    signal, f_samp, f_inter, f_dopp, chip = Signal.GPSL1CA(3), 4.092e6, 1.2e6, 850., 301.3
+    packed = packed_recording(signal, f_samp, f_inter, f_dopp, chip, 4092)
+    integer_samples = SampleUnpacker(4, False, integer=True).unpack(packed)
+    samples = SampleUnpacker(4, False).unpack(packed)
+    reference = numpy.asarray(list(Correlator().correlate_block(signal, samples, f_samp, f_inter, chip, f_dopp,
+                                                                 0.)[0]))
+    outputs = numpy.asarray(Correlator(mode='integer').correlate_block(signal, integer_samples, f_samp, f_inter,
+                                                                       chip, f_dopp, 0.)[0])
+    assert numpy.max(numpy.absolute(outputs - reference)) < .05 * numpy.absolute(reference[1])
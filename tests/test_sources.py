@@ -0,0 +1,45 @@
+import numpy
+import pytest
+from gnss.receiver import FileSource, FileSource4BitComplexWithMetaData
+from gnss.receiver.unpacking import SampleUnpacker
+
+
+def check_reads_to_end(source, samples, overlap):
+    """
+    Loads and advances `source` to the end of its file, checking each buffer
+    against `samples`, and checks that advancing past the end raises `EOFError`.
+    """
+    source.load()
+    start = 0
+    while True:
+        n = int(round(source.buffer_start_time * source.f_samp))
+        assert n == start
+        assert source.max_time == pytest.approx((n + len(source.buffer)) / source.f_samp)
+        numpy.testing.assert_array_equal(source.buffer, samples[n:n + len(source.buffer)])
+        if n + len(source.buffer) == len(samples):
+            break
+        assert len(source.buffer) == source.buffer_size
+        start = n + len(source.buffer) - overlap
+        source.advance(overlap)
+    assert len(source.buffer) < source.buffer_size
+    with pytest.raises(EOFError):
+        source.advance(overlap)
+    numpy.testing.assert_array_equal(source.buffer, samples[n:])
+
+
+def test_file_source_reads_past_end_of_short_file(tmp_path):
+    packed = numpy.random.default_rng(0).integers(0, 256, 2500).astype(numpy.uint8)
+    filepath = str(tmp_path / 'recording.bin')
+    packed.tofile(filepath)
+    source = FileSource(filepath, 1e6, 0., 4, False, buffer_size=1000)
+    check_reads_to_end(source, SampleUnpacker(4, False).unpack(packed), 100)
+
+
+def test_framed_file_source_reads_past_end_of_short_file(tmp_path):
+    rng = numpy.random.default_rng(0)
+    packed = rng.integers(0, 256, (25, 100)).astype(numpy.uint8)
+    headers = rng.integers(0, 256, (25, 21)).astype(numpy.uint8)
+    filepath = str(tmp_path / 'recording.bin')
+    numpy.hstack((headers, packed)).tofile(filepath)
+    source = FileSource4BitComplexWithMetaData(filepath, 100e3, 0., buffer_size=1000, cache_index=False)
+    check_reads_to_end(source, SampleUnpacker(4, False).unpack(packed.ravel()), 100)